@@ -1,14 +1,34 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 
-from auth.jwt_middleware import jwt_middleware
-from metrics.middleware import metrics_middleware
+from auth.jwt_middleware import JWTMiddleware
+from metrics.middleware import MetricsMiddleware
 from router import llm_router
 from registry.provider_registry import provider_registry
+from registry.routing_table import routing_table
+from tokenization.service import tokenizer
+from usage.ledger import usage_ledger
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await tokenizer.startup()
+    await provider_registry.startup()
+    await usage_ledger.start()
+    await routing_table.start()
+    try:
+        yield
+    finally:
+        await routing_table.stop()
+        await provider_registry.shutdown()
+        await tokenizer.shutdown()
+        await usage_ledger.stop()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,8 +38,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.add_middleware(BaseHTTPMiddleware, dispatch=metrics_middleware)
-app.add_middleware(BaseHTTPMiddleware, dispatch=jwt_middleware)
+app.add_middleware(MetricsMiddleware, ledger=usage_ledger if usage_ledger.enabled else None)
+app.add_middleware(JWTMiddleware)
 
 app.include_router(llm_router)
 
@@ -32,6 +52,13 @@ async def root():
     }
 
 
+@app.get("/ready")
+async def readiness():
+    if not provider_registry.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import httpx
+import jwt
+
+from metrics.middleware import JWT_CACHE_HITS, JWT_CACHE_MISSES, JWT_CACHE_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class VerifiedTokenCache:
+    
+    def __init__(self, max_size, max_ttl):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            JWT_CACHE_MISSES.inc()
+            return None
+        
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            JWT_CACHE_MISSES.inc()
+            return None
+        
+        self._entries.move_to_end(key)
+        JWT_CACHE_HITS.inc()
+        return claims
+
+    def put(self, key, claims):
+        now = time.time()
+        expires_at = now + self.max_ttl
+        
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        
+        if expires_at <= now:
+            return
+        
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            JWT_CACHE_EVICTIONS.inc()
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class JWKSCache:
+    
+    MIN_REFRESH_INTERVAL = 10.0
+
+    def __init__(self, url, ttl):
+        self.url = url
+        self.ttl = ttl
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = asyncio.Lock()
+
+    async def get_signing_key(self, kid):
+        if self._is_stale() or kid not in self._keys:
+            await self.refresh()
+        
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Signing key '{kid}' not found in JWKS")
+        return key
+
+    async def refresh(self):
+        async with self._lock:
+            if self._fetched_at is not None:
+                age = time.monotonic() - self._fetched_at
+                if age < self.MIN_REFRESH_INTERVAL:
+                    return
+            
+            try:
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    response = await client.get(self.url)
+                    response.raise_for_status()
+                    jwks = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("Failed to fetch JWKS from %s: %s", self.url, e)
+                self._fetched_at = time.monotonic()
+                return
+            
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    keys[jwk.get("kid")] = jwt.PyJWK(jwk).key
+                except jwt.PyJWKError as e:
+                    logger.warning("Skipping unusable JWK '%s': %s", jwk.get("kid"), e)
+            
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def _is_stale(self):
+        return self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl
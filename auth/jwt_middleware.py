@@ -1,53 +1,87 @@
 import jwt
-from fastapi import Request
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from auth.jwt_cache import VerifiedTokenCache, JWKSCache, token_digest
 from config import settings
 
 
-async def jwt_middleware(request: Request, call_next):
-    
-    if request.url.path in ["/metrics", "/health", "/"]:
-        return await call_next(request)
-    
-    if not request.url.path.startswith("/v1/"):
-        return await call_next(request)
-    
-    auth_header = request.headers.get("Authorization")
-    
-    if not auth_header:
-        return JSONResponse(
-            status_code=401,
-            content={"error": "Missing Authorization header"}
-        )
-    
-    parts = auth_header.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
-        return JSONResponse(
-            status_code=401,
-            content={"error": "Invalid Authorization header"}
-        )
+EXEMPT_PATHS = {"/metrics", "/health", "/ready", "/"}
+
+token_cache = VerifiedTokenCache(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_MAX_TTL)
+jwks_cache = JWKSCache(settings.JWT_JWKS_URL, settings.JWT_JWKS_CACHE_TTL) if settings.JWT_JWKS_URL else None
+
+
+async def verify_token(token):
+    algorithm = settings.JWT_ALGORITHM
     
-    token = parts[1]
+    if algorithm.startswith("HS"):
+        key = settings.JWT_SECRET
+    elif jwks_cache is not None:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = await jwks_cache.get_signing_key(kid)
+    else:
+        key = settings.JWT_PUBLIC_KEY
     
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALGORITHM]
-        )
-        
-        request.state.user_id = payload.get("user_id")
-        request.state.email = payload.get("email")
-        
-    except jwt.ExpiredSignatureError:
-        return JSONResponse(
-            status_code=401,
-            content={"error": "Token expired"}
-        )
-    except jwt.InvalidTokenError:
-        return JSONResponse(
-            status_code=401,
-            content={"error": "Invalid token"}
-        )
+    return jwt.decode(token, key, algorithms=[algorithm])
+
+
+class JWTMiddleware:
     
-    return await call_next(request)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        path = scope["path"]
+        
+        if path in EXEMPT_PATHS or not path.startswith("/v1/"):
+            return await self.app(scope, receive, send)
+        
+        auth_header = Headers(scope=scope).get("Authorization")
+        
+        if not auth_header:
+            response = JSONResponse(
+                status_code=401,
+                content={"error": "Missing Authorization header"}
+            )
+            return await response(scope, receive, send)
+        
+        parts = auth_header.split()
+        if len(parts) != 2 or parts[0].lower() != "bearer":
+            response = JSONResponse(
+                status_code=401,
+                content={"error": "Invalid Authorization header"}
+            )
+            return await response(scope, receive, send)
+        
+        token = parts[1]
+        cache_key = token_digest(token) if settings.JWT_CACHE_SIZE > 0 else None
+        payload = token_cache.get(cache_key) if cache_key else None
+        
+        if payload is None:
+            try:
+                payload = await verify_token(token)
+            except jwt.ExpiredSignatureError:
+                response = JSONResponse(
+                    status_code=401,
+                    content={"error": "Token expired"}
+                )
+                return await response(scope, receive, send)
+            except jwt.InvalidTokenError:
+                response = JSONResponse(
+                    status_code=401,
+                    content={"error": "Invalid token"}
+                )
+                return await response(scope, receive, send)
+            
+            if cache_key:
+                token_cache.put(cache_key, payload)
+        
+        state = scope.setdefault("state", {})
+        state["user_id"] = payload.get("user_id")
+        state["email"] = payload.get("email")
+        state["claims"] = payload
+        
+        await self.app(scope, receive, send)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Non-streaming JSON overhead benchmark for AI Proxy Gateway
+
+Drives the ASGI app in-process with a fake provider that answers instantly
+with a prebuilt upstream body, so every microsecond measured is spent in
+the gateway (auth, metrics, request parsing, payload building, response
+handling). Compares two provider behaviours for small and ~100KB request
+and response payloads:
+
+  passthrough  upstream bytes are forwarded untouched (RawResponse)
+  reserialize  upstream body is parsed into a dict and serialised again
+               (what happens when the response has to be translated)
+
+Reports wall-clock latency and CPU time per request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("PROVIDER_WARMUP", "false")
+
+
+def build_request(size):
+    content = "x" * max(1, size // 100)
+    count = 1 if size < 1000 else 100
+    return json.dumps({
+        "model": "openai/fake-model",
+        "messages": [{"role": "user", "content": content} for _ in range(count)],
+        "temperature": 0.7
+    }).encode()
+
+
+def build_upstream_body(size):
+    return json.dumps({
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "model": "fake-model",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "y" * max(1, size)},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+    }, indent=2).encode()
+
+
+def install_fake_provider(upstream_body, mode):
+    from providers.base import BaseProvider
+    from registry.provider_registry import provider_registry
+
+    class FakeProvider(BaseProvider):
+        schema = "openai"
+
+        def __init__(self):
+            self.capabilities = {"fake-model": {"max_tokens": 8192}}
+
+        async def generate(self, payload, stream):
+            if mode == "passthrough":
+                from providers.base import RawResponse
+                return RawResponse(upstream_body)
+            return json.loads(upstream_body)
+
+        async def count_tokens(self, input_text, output_text):
+            return 0, 0
+
+        async def stream_from_response(self, response):
+            from streaming.sse import sse_chunk
+            yield sse_chunk(response)
+
+        def get_model_capabilities(self, model):
+            return self.capabilities[model]
+    
+    provider_registry.instances["openai"] = FakeProvider()
+
+
+def generate_token(secret="your-secret-key-change-in-production"):
+    payload = {
+        "user_id": "bench_user",
+        "email": "bench@example.com",
+        "exp": datetime.utcnow() + timedelta(hours=1)
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+async def call(app, body, token):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"authorization", b"Bearer " + token.encode())
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000)
+    }
+    received = False
+    status = None
+    size = 0
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+    
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"Unexpected status {status}")
+    return size
+
+
+async def measure(app, token, mode, size, requests):
+    body = build_request(size)
+    install_fake_provider(build_upstream_body(size), mode)
+    
+    for _ in range(min(200, requests)):
+        await call(app, body, token)
+    
+    latencies = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response_size = await call(app, body, token)
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    
+    latencies.sort()
+    return {
+        "mode": mode,
+        "payload_bytes": size,
+        "request_bytes": len(body),
+        "response_bytes": response_size,
+        "requests_per_sec": requests / wall,
+        "latency_us_p50": statistics.median(latencies) * 1e6,
+        "latency_us_p99": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        "cpu_us_per_request": cpu / requests * 1e6
+    }
+
+
+async def run(args):
+    os.chdir(ROOT)
+    from app import app
+    
+    token = generate_token()
+    results = []
+    for size in args.sizes:
+        for mode in args.modes:
+            results.append(await measure(app, token, mode, size, args.requests))
+    print(json.dumps({"requests": args.requests, "results": results}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 100_000])
+    parser.add_argument("--modes", nargs="+", default=["passthrough", "reserialize"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
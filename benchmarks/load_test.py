@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Load test for AI Proxy Gateway against local mock upstreams
+
+Starts the fake OpenAI and Anthropic servers from mock_upstream.py in this
+process and runs the real gateway (real providers, pools, auth, metrics) in
+a subprocess pointed at them, so no API keys or network are needed. Every
+scenario gets a fresh gateway process so memory, event-loop lag and breaker
+state don't leak between scenarios.
+
+Per scenario it reports throughput, status counts, client latency and
+gateway overhead percentiles (client latency minus the time the mock was
+told to take), gateway RSS, memory per open stream and event-loop lag
+sampled inside the gateway. Results are printed as JSON and optionally
+written to --output for comparing runs.
+
+  python benchmarks/load_test.py
+  python benchmarks/load_test.py --scenarios streaming concurrent_streams --streams 5000
+  python benchmarks/load_test.py --scale 0.1 --mock ttft=0.2 --output before.json
+
+The driver and the mock share one event loop; on small machines compare
+runs made on the same hardware rather than reading the numbers as absolute.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_upstream import MockUpstream, start_mock_server, stop_mock_server
+
+
+MODELS = ["openai/gpt-4-turbo", "claude/claude-3-haiku"]
+
+SCENARIOS = {
+    "non_streaming": {
+        "stream": False, "requests": 2000, "concurrency": 50,
+        "mock": {"latency": 0.05, "payload_bytes": 1000}
+    },
+    "streaming": {
+        "stream": True, "requests": 500, "concurrency": 50,
+        "mock": {"ttft": 0.1, "chunk_interval": 0.01, "chunks": 50, "payload_bytes": 2000}
+    },
+    "large_prompt": {
+        "stream": False, "requests": 200, "concurrency": 20, "prompt_bytes": 200_000,
+        "mock": {"latency": 0.05, "payload_bytes": 1000}
+    },
+    "auth_failure": {
+        "stream": False, "requests": 2000, "concurrency": 50, "token": "invalid",
+        "mock": {}
+    },
+    "upstream_errors": {
+        "stream": False, "requests": 1000, "concurrency": 50,
+        "mock": {"latency": 0.05, "error_rate": 0.1}
+    },
+    "concurrent_streams": {
+        "stream": True, "requests": 2000, "concurrency": 2000, "hold": True,
+        "mock": {"ttft": 0.5, "chunk_interval": 0.5, "chunks": 10, "payload_bytes": 500}
+    }
+}
+
+
+class LoopLagProbe:
+    """Measures how late a short sleep wakes up on the gateway's loop"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def reset(self):
+        self.samples = []
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def snapshot(self):
+        return percentiles(self.samples)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS, but the best available off Linux
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def serve(port):
+    """Run the real gateway with a stats route for the driver"""
+    import uvicorn
+    from app import app
+    
+    probe = LoopLagProbe()
+
+    async def bench_stats(reset: bool = False):
+        probe.start()
+        stats = {"loop_lag_ms": probe.snapshot(), "rss_bytes": rss_bytes()}
+        if reset:
+            probe.reset()
+        return stats
+    
+    app.add_api_route("/__bench/stats", bench_stats, methods=["GET"])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False, backlog=4096)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values, scale=1000):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(q):
+        return values[min(len(values) - 1, int(len(values) * q))] * scale
+    
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": values[-1] * scale}
+
+
+def generate_token(secret="your-secret-key-change-in-production"):
+    payload = {
+        "user_id": "bench_user",
+        "email": "bench@example.com",
+        "exp": datetime.utcnow() + timedelta(hours=1)
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def build_body(scenario, index):
+    content = "x" * scenario.get("prompt_bytes", 100)
+    return json.dumps({
+        "model": MODELS[index % len(MODELS)],
+        "messages": [{"role": "user", "content": content}],
+        "stream": scenario["stream"],
+        "temperature": 0.7
+    }).encode()
+
+
+class Gateway:
+    """The gateway under test in its own process"""
+
+    def __init__(self, upstream_port, connections):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        upstream = f"http://127.0.0.1:{upstream_port}"
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{upstream}/v1/chat/completions",
+            "CLAUDE_BASE_URL": f"{upstream}/v1/messages",
+            "OPENAI_API_KEY": "mock",
+            "ANTHROPIC_API_KEY": "mock",
+            "PROVIDER_WARMUP": "false",
+            "UPSTREAM_HTTP2": "false",
+            "UPSTREAM_MAX_CONNECTIONS": str(connections),
+            "UPSTREAM_MAX_KEEPALIVE_CONNECTIONS": str(connections)
+        }
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(self.port)],
+            cwd=ROOT, env=env
+        )
+
+    async def wait_until_up(self, client):
+        for _ in range(200):
+            if self.process.poll() is not None:
+                raise RuntimeError("Gateway exited during startup")
+            try:
+                await client.get(self.base_url + "/__bench/stats")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.05)
+        raise RuntimeError("Gateway did not start")
+
+    async def stats(self, client, reset=False):
+        response = await client.get(self.base_url + "/__bench/stats", params={"reset": str(reset).lower()})
+        response.raise_for_status()
+        return response.json()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+async def send_one(client, scenario, index, headers, first_chunk=None):
+    """Returns (status, latency, ttft); ttft is None for non-streaming"""
+    body = build_body(scenario, index)
+    start = time.perf_counter()
+    ttft = None
+    try:
+        if not scenario["stream"]:
+            response = await client.post("/v1/chat/completions", content=body, headers=headers)
+            return response.status_code, time.perf_counter() - start, None
+        
+        async with client.stream("POST", "/v1/chat/completions", content=body, headers=headers) as response:
+            async for chunk in response.aiter_raw():
+                if ttft is None and chunk:
+                    ttft = time.perf_counter() - start
+                    if first_chunk:
+                        first_chunk()
+            return response.status_code, time.perf_counter() - start, ttft
+    except httpx.HTTPError as e:
+        return type(e).__name__, time.perf_counter() - start, ttft
+    finally:
+        if first_chunk and ttft is None:
+            first_chunk()
+
+
+async def run_scenario(name, scenario, mock, upstream_port, control):
+    mock.configure(**scenario["mock"])
+    concurrency = scenario["concurrency"]
+    total = scenario["requests"]
+    gateway = Gateway(upstream_port, connections=max(100, concurrency + 50))
+    token = scenario.get("token") or generate_token()
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0, pool=None)
+    
+    try:
+        await gateway.wait_until_up(control)
+        async with httpx.AsyncClient(base_url=gateway.base_url, limits=limits, timeout=timeout) as client:
+            warmup = min(20, total)
+            await asyncio.gather(*[send_one(client, scenario, i, headers) for i in range(warmup)])
+            idle = await gateway.stats(control, reset=True)
+            mock_errors = mock.errors
+            mock_requests = mock.requests
+            
+            results = []
+            open_stats = None
+            start = time.perf_counter()
+            
+            if scenario.get("hold"):
+                # Every stream is opened at once; gateway memory is sampled
+                # while they are all between first and last chunk
+                started = 0
+                all_started = asyncio.Event()
+
+                def first_chunk():
+                    nonlocal started
+                    started += 1
+                    if started == total:
+                        all_started.set()
+                
+                tasks = [asyncio.create_task(send_one(client, scenario, i, headers, first_chunk))
+                         for i in range(total)]
+                await all_started.wait()
+                open_stats = await gateway.stats(control)
+                open_stats["mock_open_streams"] = mock.open_streams
+                results = await asyncio.gather(*tasks)
+            else:
+                remaining = total
+
+                async def worker():
+                    nonlocal remaining
+                    while remaining > 0:
+                        remaining -= 1
+                        results.append(await send_one(client, scenario, remaining, headers))
+                
+                await asyncio.gather(*[worker() for _ in range(concurrency)])
+            
+            elapsed = time.perf_counter() - start
+            end = await gateway.stats(control)
+    finally:
+        gateway.stop()
+    
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    
+    ok = [(latency, ttft) for status, latency, ttft in results if status == 200]
+    if scenario["stream"]:
+        overhead = [latency - mock.stream_time() for latency, _ in ok]
+        ttft_overhead = [ttft - mock.ttft for _, ttft in ok if ttft is not None]
+    elif scenario.get("token"):
+        overhead = []
+        ttft_overhead = []
+    else:
+        overhead = [latency - mock.latency for latency, _ in ok]
+        ttft_overhead = []
+    
+    report = {
+        "name": name,
+        "stream": scenario["stream"],
+        "requests": total,
+        "concurrency": concurrency,
+        "mock": {
+            "latency": mock.latency,
+            "ttft": mock.ttft,
+            "chunk_interval": mock.chunk_interval,
+            "chunks": mock.chunks,
+            "error_rate": mock.error_rate,
+            "payload_bytes": mock.payload_bytes
+        },
+        "prompt_bytes": scenario.get("prompt_bytes", 100),
+        "seconds": elapsed,
+        "throughput_rps": total / elapsed,
+        "status_counts": statuses,
+        "upstream_requests": mock.requests - mock_requests,
+        "upstream_errors": mock.errors - mock_errors,
+        "latency_ms": percentiles([latency for _, latency, _ in results]),
+        "gateway_overhead_ms": percentiles([max(0.0, value) for value in overhead]),
+        "ttft_ms": percentiles([ttft for _, ttft in ok if ttft is not None]),
+        "ttft_overhead_ms": percentiles([max(0.0, value) for value in ttft_overhead]),
+        "loop_lag_ms": end["loop_lag_ms"],
+        "gateway_rss_bytes": {"idle": idle["rss_bytes"], "end": end["rss_bytes"]}
+    }
+    if open_stats:
+        report["gateway_rss_bytes"]["streams_open"] = open_stats["rss_bytes"]
+        report["open_streams_at_sample"] = open_stats["mock_open_streams"]
+        report["memory_per_stream_bytes"] = (open_stats["rss_bytes"] - idle["rss_bytes"]) / total
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_overrides(items):
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        overrides[key.replace("-", "_")] = int(value) if value.isdigit() else float(value)
+    return overrides
+
+
+async def run(args):
+    overrides = parse_overrides(args.mock)
+    mock = MockUpstream(seed=args.seed)
+    defaults = {key: getattr(mock, key) for key in
+                ("latency", "ttft", "chunk_interval", "chunks", "error_rate", "payload_bytes")}
+    server, task, upstream_port = await start_mock_server(mock)
+    
+    reports = []
+    try:
+        async with httpx.AsyncClient(timeout=30) as control:
+            for name in args.scenarios:
+                scenario = dict(SCENARIOS[name])
+                scenario["mock"] = {**defaults, **scenario["mock"], **overrides}
+                if scenario.get("hold"):
+                    scenario["requests"] = scenario["concurrency"] = args.streams
+                else:
+                    scenario["requests"] = max(1, int(scenario["requests"] * args.scale))
+                print(f"running {name}...", file=sys.stderr)
+                reports.append(await run_scenario(name, scenario, mock, upstream_port, control))
+    finally:
+        await stop_mock_server(server, task)
+    
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "scenarios": reports
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for request counts")
+    parser.add_argument("--streams", type=int, default=2000, help="Open streams in concurrent_streams")
+    parser.add_argument("--mock", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="Override mock settings for every scenario, e.g. ttft=0.2 error_rate=0.05")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        os.chdir(ROOT)
+        serve(args.port)
+        return
+    
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
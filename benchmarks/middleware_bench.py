@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Middleware overhead benchmark for AI Proxy Gateway
+
+Runs the gateway under uvicorn in a subprocess with a fake provider, so only
+the gateway's own auth/metrics/router stack is measured. Reports requests/sec
+for a small authenticated endpoint and per-chunk latency for SSE streams.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def serve(port, chunks, chunk_interval):
+    """Run the gateway with every provider replaced by a fake one"""
+    os.environ.setdefault("PROVIDER_WARMUP", "false")
+    import uvicorn
+    from app import app
+    from providers.base import BaseProvider
+    from registry.provider_registry import provider_registry
+
+    class FakeProvider(BaseProvider):
+
+        def __init__(self):
+            self.capabilities = {"fake-model": {"max_tokens": 8192}}
+
+        async def generate(self, payload, stream):
+            if not stream:
+                return {
+                    "id": "bench",
+                    "model": payload["model"],
+                    "choices": [{"message": {"role": "assistant", "content": "ok"}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+                }
+            return self._stream()
+
+        async def _stream(self):
+            for _ in range(chunks):
+                if chunk_interval:
+                    await asyncio.sleep(chunk_interval)
+                data = json.dumps({
+                    "sent_at": time.time(),
+                    "choices": [{"delta": {"content": "x"}}]
+                })
+                yield b"data: " + data.encode() + b"\n\n"
+
+        async def count_tokens(self, input_text, output_text):
+            return 0, 0
+
+        async def stream_from_response(self, response):
+            from streaming.sse import sse_chunk
+            yield sse_chunk(response)
+
+        def get_model_capabilities(self, model):
+            return self.capabilities[model]
+
+    for name in list(provider_registry.instances):
+        provider_registry.instances[name] = FakeProvider()
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def generate_token(secret="your-secret-key-change-in-production"):
+    """Generate a JWT token for benchmarking"""
+    payload = {
+        "user_id": "bench_user",
+        "email": "bench@example.com",
+        "exp": datetime.utcnow() + timedelta(hours=1)
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+async def wait_until_up(base_url):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(base_url + "/")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("Gateway did not start")
+
+
+async def bench_requests(base_url, headers, total, concurrency):
+    """Requests/sec for GET /v1/models through auth and metrics"""
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits) as client:
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get("/v1/models")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return {"requests": total, "seconds": elapsed, "requests_per_sec": total / elapsed}
+
+
+async def bench_streaming(base_url, headers, streams, concurrency):
+    """Per-chunk latency from provider yield to client receive"""
+    body = {
+        "model": "openai/fake-model",
+        "messages": [{"role": "user", "content": "hi"}],
+        "stream": True
+    }
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        remaining = streams
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                async with client.stream("POST", "/v1/chat/completions", json=body) as response:
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            received = time.time()
+                            sent_at = json.loads(line[6:]).get("sent_at")
+                            if sent_at:
+                                latencies.append(received - sent_at)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "streams": streams,
+        "chunks": len(latencies),
+        "chunks_per_sec": len(latencies) / elapsed,
+        "chunk_latency_ms_p50": statistics.median(latencies) * 1000 if latencies else None,
+        "chunk_latency_ms_p99": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None
+    }
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    headers = {"Authorization": f"Bearer {generate_token()}"}
+    await wait_until_up(base_url)
+
+    results = {
+        "requests": await bench_requests(base_url, headers, args.requests, args.concurrency),
+        "streaming": await bench_streaming(base_url, headers, args.streams, args.concurrency)
+    }
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--chunk-interval", type=float, default=0.001)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        os.chdir(ROOT)
+        serve(args.port, args.chunks, args.chunk_interval)
+        return
+
+    server = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(args.port),
+        "--chunks", str(args.chunks),
+        "--chunk-interval", str(args.chunk_interval)
+    ])
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI and Anthropic upstreams for AI Proxy Gateway benchmarks
+
+A single ASGI app that answers both wire formats:
+
+  POST /v1/chat/completions  OpenAI chat completions (JSON or SSE)
+  POST /v1/messages          Anthropic messages (JSON or SSE)
+
+Latency, time to first token, chunk cadence, error rate and payload size are
+attributes of the MockUpstream instance, so a driver running it in-process
+can change them between scenarios. It can also be run on its own and pointed
+at with OPENAI_BASE_URL / CLAUDE_BASE_URL for manual testing:
+
+  python benchmarks/mock_upstream.py --port 9100 --ttft 0.2 --chunks 50
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import uvicorn
+
+
+class MockUpstream:
+    
+    def __init__(self, latency=0.05, ttft=0.05, chunk_interval=0.01, chunks=20,
+                 error_rate=0.0, payload_bytes=200, seed=None):
+        self.latency = latency
+        self.ttft = ttft
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.disconnects = 0
+        self.open_streams = 0
+        self._ids = itertools.count()
+
+    def configure(self, **options):
+        for name, value in options.items():
+            if not hasattr(self, name):
+                raise AttributeError(f"Unknown mock option {name}")
+            setattr(self, name, value)
+
+    def stream_time(self):
+        """Upstream time of a full stream, what the gateway cannot do better than"""
+        return self.ttft + max(0, self.chunks - 1) * self.chunk_interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                else:
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        
+        self.requests += 1
+        # Like a real upstream, stop generating once the caller hangs up
+        response = asyncio.ensure_future(self._respond(scope["method"], scope["path"], body, send))
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait((response, disconnected), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnected.cancel()
+            if not response.done():
+                response.cancel()
+                self.disconnects += 1
+        if response.done() and not response.cancelled():
+            response.result()
+
+    async def _wait_for_disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _respond(self, method, path, body, send):
+        if method != "POST" or path not in ("/v1/chat/completions", "/v1/messages"):
+            await self._send_json(send, 404, {"error": {"message": "Not found"}})
+            return
+        
+        anthropic = path == "/v1/messages"
+        request = json.loads(body or b"{}")
+        
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency)
+            status = 529 if anthropic else 500
+            await self._send_json(send, status, {"error": {"type": "api_error", "message": "Injected failure"}})
+            return
+        
+        message_id = f"mock-{next(self._ids)}"
+        model = request.get("model", "mock-model")
+        prompt_tokens = max(1, len(body) // 4)
+        
+        if request.get("stream"):
+            self.open_streams += 1
+            try:
+                if anthropic:
+                    await self._anthropic_stream(send, message_id, model, prompt_tokens)
+                else:
+                    await self._openai_stream(send, message_id, model, prompt_tokens)
+            finally:
+                self.open_streams -= 1
+            return
+        
+        await asyncio.sleep(self.latency)
+        text = "x" * self.payload_bytes
+        completion_tokens = max(1, self.payload_bytes // 4)
+        if anthropic:
+            response = {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+            }
+        else:
+            response = {
+                "id": message_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+        await self._send_json(send, 200, response)
+
+    def _chunk_texts(self):
+        size = max(1, self.payload_bytes // max(1, self.chunks))
+        return ["x" * size for _ in range(self.chunks)]
+
+    async def _openai_stream(self, send, message_id, model, prompt_tokens):
+        created = int(time.time())
+        texts = self._chunk_texts()
+
+        def chunk(choices, usage=None):
+            event = {"id": message_id, "object": "chat.completion.chunk",
+                     "created": created, "model": model, "choices": choices}
+            if usage:
+                event["usage"] = usage
+            return b"data: " + json.dumps(event).encode() + b"\n\n"
+        
+        await asyncio.sleep(self.ttft)
+        await self._start_stream(send)
+        for i, text in enumerate(texts):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            delta = {"role": "assistant", "content": text} if i == 0 else {"content": text}
+            await self._send_body(send, chunk([{"index": 0, "delta": delta, "finish_reason": None}]))
+        
+        completion_tokens = max(1, sum(map(len, texts)) // 4)
+        await self._send_body(send, b"".join([
+            chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]),
+            chunk([], {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                       "total_tokens": prompt_tokens + completion_tokens}),
+            b"data: [DONE]\n\n"
+        ]), more_body=False)
+
+    async def _anthropic_stream(self, send, message_id, model, prompt_tokens):
+        texts = self._chunk_texts()
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+        
+        await asyncio.sleep(self.ttft)
+        await self._start_stream(send)
+        for i, text in enumerate(texts):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            frames = []
+            if i == 0:
+                frames.append(event("message_start", {"type": "message_start", "message": {
+                    "id": message_id, "type": "message", "role": "assistant", "model": model,
+                    "content": [], "stop_reason": None,
+                    "usage": {"input_tokens": prompt_tokens, "output_tokens": 0}
+                }}))
+                frames.append(event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                            "content_block": {"type": "text", "text": ""}}))
+            frames.append(event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                        "delta": {"type": "text_delta", "text": text}}))
+            await self._send_body(send, b"".join(frames))
+        
+        completion_tokens = max(1, sum(map(len, texts)) // 4)
+        await self._send_body(send, b"".join([
+            event("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            event("message_delta", {"type": "message_delta",
+                                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                    "usage": {"output_tokens": completion_tokens}}),
+            event("message_stop", {"type": "message_stop"})
+        ]), more_body=False)
+
+    async def _start_stream(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]
+        })
+
+    async def _send_body(self, send, body, more_body=True):
+        await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _send_json(self, send, status, data):
+        body = json.dumps(data).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())]
+        })
+        await self._send_body(send, body, more_body=False)
+
+
+async def start_mock_server(mock, host="127.0.0.1", port=0):
+    """Serve mock on the running loop; returns (server, task, port)"""
+    config = uvicorn.Config(mock, host=host, port=port, log_level="warning",
+                            access_log=False, lifespan="off", backlog=4096)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("Mock upstream did not start")
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, port
+
+
+async def stop_mock_server(server, task):
+    server.should_exit = True
+    await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before a non-streaming response")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds before the first stream chunk")
+    parser.add_argument("--chunk-interval", type=float, default=0.01)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=200)
+    args = parser.parse_args()
+    
+    mock = MockUpstream(
+        latency=args.latency,
+        ttft=args.ttft,
+        chunk_interval=args.chunk_interval,
+        chunks=args.chunks,
+        error_rate=args.error_rate,
+        payload_bytes=args.payload_bytes
+    )
+    uvicorn.run(mock, host=args.host, port=args.port, log_level="warning", lifespan="off")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+SSE pipeline microbenchmark for AI Proxy Gateway
+
+Feeds a synthetic OpenAI-style event stream through httpx and compares the
+old line-based pipeline (aiter_lines, re-encode, full json parse per chunk)
+with the byte-level framer plus usage/text fast path. Reports events/sec and
+per-event overhead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streaming.sse import iter_sse
+from usage.tracker import StreamUsageTracker
+
+
+class WhitespaceTokenizer:
+    """Stand-in so the benchmark does not depend on downloading tiktoken data"""
+
+    available = True
+
+    def count_inline(self, text):
+        return len(text.split())
+
+
+def build_stream(events, read_size):
+    frames = []
+    for i in range(events):
+        frames.append(b"data: " + json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4",
+            "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+            "usage": None
+        }, separators=(",", ":")).encode() + b"\n\n")
+    frames.append(b"data: " + json.dumps({
+        "id": "chatcmpl-bench",
+        "choices": [],
+        "usage": {"prompt_tokens": 10, "completion_tokens": events}
+    }, separators=(",", ":")).encode() + b"\n\n")
+    frames.append(b"data: [DONE]\n\n")
+    body = b"".join(frames)
+    return [body[i:i + read_size] for i in range(0, len(body), read_size)]
+
+
+async def byte_source(reads):
+    for data in reads:
+        yield data
+
+
+def baseline_extract_text(chunk):
+    try:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8")
+        data = json.loads(chunk.strip())
+        if "choices" in data and data["choices"]:
+            return data["choices"][0].get("delta", {}).get("content", "")
+        return ""
+    except ValueError:
+        return ""
+
+
+async def run_baseline(reads):
+    response = httpx.Response(200, content=byte_source(reads))
+    forwarded = 0
+    output = []
+    async for line in response.aiter_lines():
+        if line.strip() and line.startswith("data: "):
+            data = line[6:]
+            if data.strip() == "[DONE]":
+                break
+            chunk = data.encode() + b"\n\n"
+            text = baseline_extract_text(chunk)
+            if text:
+                output.append(text)
+            forwarded += 1
+    return forwarded
+
+
+async def run_framer(reads, count_text):
+    response = httpx.Response(200, content=byte_source(reads))
+    tracker = StreamUsageTracker(WhitespaceTokenizer(), count_text=count_text)
+    forwarded = 0
+    async for frames in iter_sse(response):
+        tracker.feed(frames)
+        forwarded += 1
+    tracker.finish()
+    return forwarded
+
+
+async def measure(name, runner, reads, events, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await runner(reads)
+    elapsed = time.perf_counter() - start
+    total = events * repeat
+    return {
+        "pipeline": name,
+        "events_per_sec": total / elapsed,
+        "us_per_event": elapsed / total * 1e6
+    }
+
+
+async def run(args):
+    reads = build_stream(args.events, args.read_size)
+    results = [
+        await measure("baseline_lines", run_baseline, reads, args.events, args.repeat),
+        await measure("framer_usage_only", lambda r: run_framer(r, False), reads, args.events, args.repeat),
+        await measure("framer_count_text", lambda r: run_framer(r, True), reads, args.events, args.repeat)
+    ]
+    print(json.dumps({
+        "events": args.events,
+        "read_size": args.read_size,
+        "repeat": args.repeat,
+        "results": results
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--read-size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from config import settings
+from metrics.middleware import (
+    RESPONSE_CACHE_HITS,
+    RESPONSE_CACHE_MISSES,
+    RESPONSE_CACHE_EVICTIONS,
+    RESPONSE_CACHE_BYTES
+)
+
+
+class CacheEntry:
+    
+    __slots__ = ("body", "chunks", "expires_at", "size")
+
+    def __init__(self, expires_at):
+        self.body = None
+        self.chunks = None
+        self.expires_at = expires_at
+        self.size = 0
+
+
+class ResponseCache:
+    
+    def __init__(self, enabled, max_bytes, max_entry_bytes, ttl, scope):
+        if scope not in ("user", "global"):
+            raise ValueError("Response cache scope must be 'user' or 'global'")
+        
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.scope = scope
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def key_for(self, chat_request, user_id):
+        canonical = json.dumps({
+            "model": chat_request.model,
+            "messages": [[m.role, m.content] for m in chat_request.messages],
+            "temperature": chat_request.temperature,
+            "max_tokens": chat_request.max_tokens,
+            "scope": user_id if self.scope == "user" else None
+        }, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode()).digest()
+
+    def get(self, key, stream):
+        entry = self._entries.get(key)
+        
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        
+        if entry is None or (not stream and entry.body is None):
+            RESPONSE_CACHE_MISSES.inc()
+            return None
+        
+        self._entries.move_to_end(key)
+        RESPONSE_CACHE_HITS.inc()
+        return entry
+
+    def put_response(self, key, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        entry = self._entry_for_update(key)
+        entry.body = body
+        self._resize(entry)
+
+    def put_stream(self, key, chunks):
+        entry = self._entry_for_update(key)
+        entry.chunks = chunks
+        self._resize(entry)
+
+    def _entry_for_update(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            entry = CacheEntry(time.monotonic() + self.ttl)
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+        return entry
+
+    def _resize(self, entry):
+        size = len(entry.body or b"") + sum(len(chunk) for chunk in entry.chunks or ())
+        self.size += size - entry.size
+        entry.size = size
+        
+        while self.size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            RESPONSE_CACHE_EVICTIONS.inc()
+        
+        RESPONSE_CACHE_BYTES.set(self.size)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+
+
+response_cache = ResponseCache(
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    scope=settings.RESPONSE_CACHE_SCOPE
+)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+
+from config import settings
+from metrics.middleware import SINGLE_FLIGHT_COALESCED
+
+logger = logging.getLogger(__name__)
+
+# Keeps closing sources referenced until they are done
+cleanup_tasks = set()
+
+
+class Flight:
+    
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class FlightAbandoned(Exception):
+    pass
+
+
+class StreamFlight:
+    """Registered as soon as the leader starts, so identical streams that
+    arrive while it waits for admission or the first byte join it rather
+    than going upstream. Followers wait on ready, which fails with the
+    leader's error, or FlightAbandoned if the leader went away.
+    
+    Chunks are kept so a late joiner can replay the stream from the start,
+    up to max_bytes; past that the flight takes no new subscribers and only
+    keeps what the current ones have yet to read"""
+
+    def __init__(self, on_done, max_bytes):
+        self.chunks = []
+        # Position of chunks[0] in the stream once the start is dropped
+        self.offset = 0
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.joinable = True
+        self.done = False
+        self.error = None
+        self.ready = asyncio.get_running_loop().create_future()
+        self._subscriptions = set()
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = None
+
+    def start(self, source, on_close=None):
+        """Pumps source for the subscribers; on_close runs after it has been
+        closed, for cleanup a source that never started would skip"""
+        self._task = asyncio.create_task(self._pump(source))
+        self._task.add_done_callback(lambda task: self._finish(task, source, on_close))
+        self.ready.set_result(None)
+
+    def abandon(self, error=None):
+        self.done = True
+        if not self.ready.done():
+            self.ready.set_exception(error or FlightAbandoned())
+            # Retrieved here so a flight nobody followed does not log it
+            self.ready.exception()
+        self._on_done(self)
+
+    def subscribe(self):
+        if not self.joinable:
+            raise FlightAbandoned()
+        return Subscription(self)
+
+    def leave(self, subscription):
+        self._subscriptions.discard(subscription)
+        if not self._subscriptions and not self.done:
+            # Unregistered now rather than once the pump has wound down, so
+            # an identical request cannot join a stream that is going away
+            self.joinable = False
+            self._on_done(self)
+            self._task.cancel()
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                if self.joinable:
+                    self.size += len(chunk)
+                    if self.size > self.max_bytes:
+                        self.joinable = False
+                        self._on_done(self)
+                if not self.joinable:
+                    self._trim()
+                self._notify()
+        except Exception as e:
+            logger.warning("Coalesced stream failed: %s", e)
+            self.error = e
+
+    def _finish(self, task, source, on_close):
+        # A done callback, so it also runs for a pump cancelled before its
+        # first step
+        if task.cancelled() and self.error is None:
+            self.error = FlightAbandoned()
+        self.done = True
+        if self.error is not None:
+            self.joinable = False
+        self._notify()
+        self._on_done(self)
+        
+        cleanup = asyncio.ensure_future(close_source(source, on_close))
+        cleanup_tasks.add(cleanup)
+        cleanup.add_done_callback(cleanup_tasks.discard)
+
+    def _trim(self):
+        read = min((subscription.position for subscription in self._subscriptions), default=self.offset)
+        if read > self.offset:
+            del self.chunks[:read - self.offset]
+            self.offset = read
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class Subscription:
+    """One reader of a StreamFlight, from its first chunk. Leaves the
+    flight when closed, even if it was never iterated"""
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.position = 0
+        self.closed = False
+        flight._subscriptions.add(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        flight = self.flight
+        while not self.closed:
+            index = self.position - flight.offset
+            if index < len(flight.chunks):
+                self.position += 1
+                return flight.chunks[index]
+            if flight.done:
+                await self.aclose()
+                if flight.error is not None:
+                    # A stream cut short must not look complete to the client
+                    raise FlightAbandoned() from flight.error
+                break
+            await flight._changed.wait()
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.flight.leave(self)
+
+
+async def close_source(source, on_close):
+    try:
+        await source.aclose()
+        if on_close is not None:
+            await on_close()
+    except Exception as e:
+        logger.warning("Failed to close coalesced stream: %s", e)
+
+
+class SingleFlight:
+    
+    def __init__(self, enabled, max_replay_bytes):
+        self.enabled = enabled
+        self.max_replay_bytes = max_replay_bytes
+        self._calls = {}
+        self._streams = {}
+
+    async def call(self, key, factory):
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = Flight(asyncio.create_task(factory()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish_call(key, flight))
+        else:
+            SINGLE_FLIGHT_COALESCED.labels(kind="response").inc()
+        
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def open_stream(self, key):
+        """Returns the flight for key and whether the caller leads it. Runs
+        without awaiting, so exactly one caller leads; it must start() or
+        abandon() the flight"""
+        flight = self._streams.get(key)
+        if flight is not None:
+            return flight, False
+        
+        flight = StreamFlight(lambda done: self._finish_stream(key, done), self.max_replay_bytes)
+        self._streams[key] = flight
+        return flight, True
+
+    async def follow_stream(self, flight):
+        await asyncio.shield(flight.ready)
+        subscription = flight.subscribe()
+        SINGLE_FLIGHT_COALESCED.labels(kind="stream").inc()
+        return subscription
+
+    def _finish_call(self, key, flight):
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def _finish_stream(self, key, flight):
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+
+
+single_flight = SingleFlight(
+    enabled=settings.SINGLE_FLIGHT_ENABLED,
+    max_replay_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES
+)
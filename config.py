@@ -1,13 +1,104 @@
 import os
+from typing import Any, Dict, List
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     JWT_SECRET: str = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
     JWT_ALGORITHM: str = "HS256"
+    JWT_PUBLIC_KEY: str = ""
+    JWT_JWKS_URL: str = ""
+    JWT_JWKS_CACHE_TTL: float = 300.0
+    JWT_CACHE_SIZE: int = 10000
+    JWT_CACHE_MAX_TTL: float = 300.0
     
     OPENAI_BASE_URL: str = "https://api.openai.com/v1/chat/completions"
     CLAUDE_BASE_URL: str = "https://api.anthropic.com/v1/messages"
     
+    OPENAI_TARGETS: List[Dict[str, Any]] = []
+    CLAUDE_TARGETS: List[Dict[str, Any]] = []
+    UPSTREAM_BALANCING: str = "least_outstanding"
+    UPSTREAM_EJECTION_THRESHOLD: int = 3
+    UPSTREAM_EJECTION_COOLDOWN: float = 30.0
+    
+    ROUTING_TABLE_PATH: str = ""
+    ROUTING_TABLE_RELOAD_INTERVAL: float = 2.0
+    ROUTING_EWMA_ALPHA: float = 0.2
+    ROUTING_IN_FLIGHT_WEIGHT: float = 0.1
+    ROUTING_COST_WEIGHT: float = 1.0
+    ROUTING_PROBE_INTERVAL: float = 30.0
+    
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_HTTP2: bool = True
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_READ_TIMEOUT: float = 60.0
+    UPSTREAM_WRITE_TIMEOUT: float = 10.0
+    UPSTREAM_POOL_TIMEOUT: float = 5.0
+    
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_BASE_DELAY: float = 0.25
+    RETRY_MAX_DELAY: float = 8.0
+    RETRY_DEADLINE: float = 30.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_TIMEOUT: float = 30.0
+    
+    FALLBACK_CHAINS: Dict[str, List[str]] = {}
+    HEDGE_DELAY: float = 2.0
+    HEDGE_DELAY_MODE: str = "fixed"
+    HEDGE_DELAY_PERCENTILE: float = 0.95
+    HEDGE_MIN_DELAY: float = 0.25
+    
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_TIER_CLAIM: str = "tier"
+    RATE_LIMIT_TIERS: Dict[str, Dict[str, Any]] = {
+        "default": {"requests_per_second": 5.0, "burst": 10, "tokens_per_minute": 100000}
+    }
+    RATE_LIMIT_IDLE_TTL: float = 300.0
+    RATE_LIMIT_MAX_KEYS: int = 1000000
+    
+    ADMISSION_LIMITS: Dict[str, int] = {}
+    ADMISSION_DEFAULT_LIMIT: int = 0
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0
+    ADMISSION_PRIORITY_CLAIM: str = ""
+    
+    PROVIDER_WARMUP: bool = True
+    PROVIDER_WARMUP_CONNECTIONS: int = 2
+    PROVIDER_WARMUP_TIMEOUT: float = 10.0
+    
+    TOKENIZER_WORKERS: int = 2
+    TOKENIZER_INLINE_THRESHOLD: int = 4096
+    MESSAGE_TOKEN_CACHE_BYTES: int = 16 * 1024 * 1024
+    
+    CONTEXT_POLICY: str = "reject"
+    CONTEXT_KEEP_LAST: int = 20
+    
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    RESPONSE_CACHE_TTL: float = 3600.0
+    RESPONSE_CACHE_SCOPE: str = "user"
+    SINGLE_FLIGHT_ENABLED: bool = True
+    
+    BATCH_MAX_REQUESTS: int = 1000
+    BATCH_MAX_BYTES: int = 16 * 1024 * 1024
+    BATCH_PROVIDER_CONCURRENCY: int = 8
+    
+    USAGE_LEDGER_ENABLED: bool = False
+    USAGE_LEDGER_PATH: str = "logs/usage-{pid}.jsonl"
+    USAGE_LEDGER_MAX_BYTES: int = 100 * 1024 * 1024
+    USAGE_LEDGER_ROTATE_INTERVAL: float = 3600.0
+    USAGE_LEDGER_COMPRESS: bool = True
+    USAGE_LEDGER_QUEUE_SIZE: int = 10000
+    USAGE_LEDGER_BATCH_SIZE: int = 500
+    USAGE_LEDGER_FLUSH_INTERVAL: float = 1.0
+    
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 0
+    SHUTDOWN_GRACE_PERIOD: float = 30.0
+    
     PROMETHEUS_PORT: int = 8001
     
     class Config:
@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from config import settings
+from metrics.middleware import (
+    ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_SHED
+)
+
+
+HOLD_TIME_SMOOTHING = 0.1
+
+
+class AdmissionRejected(Exception):
+    
+    def __init__(self, scope, reason, retry_after):
+        super().__init__(f"Upstream {scope} is overloaded ({reason})")
+        self.scope = scope
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    __slots__ = ("limiter", "acquired_at", "released")
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released or self.limiter is None:
+            return
+        self.released = True
+        self.limiter.release(time.monotonic() - self.acquired_at)
+
+
+NO_LIMIT = AdmissionTicket(None)
+
+
+class ConcurrencyLimiter:
+    
+    def __init__(self, scope, limit, max_queue, queue_timeout):
+        self.scope = scope
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.avg_hold = None
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(scope=scope)
+        self._queue_gauge = ADMISSION_QUEUE_DEPTH.labels(scope=scope)
+        self._wait_histogram = ADMISSION_WAIT_SECONDS.labels(scope=scope)
+
+    def expected_wait(self):
+        if self.avg_hold is None:
+            return None
+        return (self.queued + 1) * self.avg_hold / self.limit
+
+    def try_acquire(self):
+        """A ticket if a slot is free right now, otherwise None"""
+        if self.in_flight < self.limit and not self.queued:
+            self.in_flight += 1
+            self._in_flight_gauge.set(self.in_flight)
+            return AdmissionTicket(self)
+        return None
+
+    async def acquire(self, priority=0):
+        if self.in_flight < self.limit and not self.queued:
+            self.in_flight += 1
+            self._in_flight_gauge.set(self.in_flight)
+            self._wait_histogram.observe(0)
+            return AdmissionTicket(self)
+        
+        if self.queued >= self.max_queue:
+            self._shed("queue_full", self.expected_wait() or self.queue_timeout)
+        expected = self.expected_wait()
+        if expected is not None and expected > self.queue_timeout:
+            # Would time out in the queue anyway; fail now instead of
+            # holding a coroutine and its request body for the full timeout
+            self._shed("expected_wait", expected)
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._sequence), future))
+        self.queued += 1
+        self._queue_gauge.set(self.queued)
+        start = time.monotonic()
+        
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._leave_queue(future)
+            self._shed("timeout", self.expected_wait() or self.queue_timeout)
+        except BaseException:
+            self._leave_queue(future)
+            raise
+        
+        self._wait_histogram.observe(time.monotonic() - start)
+        return AdmissionTicket(self)
+
+    def release(self, held):
+        if self.avg_hold is None:
+            self.avg_hold = held
+        else:
+            self.avg_hold += HOLD_TIME_SMOOTHING * (held - self.avg_hold)
+        self._hand_off()
+
+    def _hand_off(self):
+        # Hand the slot straight to the next live waiter so nobody can
+        # barge in between release and wake-up
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.queued -= 1
+                self._queue_gauge.set(self.queued)
+                future.set_result(None)
+                return
+        
+        self.in_flight -= 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def _leave_queue(self, future):
+        if future.done() and not future.cancelled():
+            # The slot was handed over just as the waiter gave up
+            self._hand_off()
+            return
+        future.cancel()
+        self.queued -= 1
+        self._queue_gauge.set(self.queued)
+
+    def _shed(self, reason, retry_after):
+        ADMISSION_SHED.labels(scope=self.scope, reason=reason).inc()
+        raise AdmissionRejected(self.scope, reason, retry_after)
+
+
+class AdmissionController:
+    
+    def __init__(self, limits, default_limit, max_queue, queue_timeout, priority_claim):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.priority_claim = priority_claim
+        self._limiters = {}
+
+    def priority_for(self, claims):
+        if not self.priority_claim or not claims:
+            return 0
+        try:
+            return int(claims.get(self.priority_claim) or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def limiter_for(self, provider_name, model_name):
+        route = f"{provider_name}/{model_name}"
+        if route in self._limiters:
+            return self._limiters[route]
+        
+        if route in self.limits:
+            scope, limit = route, self.limits[route]
+        elif provider_name in self.limits:
+            scope, limit = provider_name, self.limits[provider_name]
+        else:
+            scope, limit = route, self.default_limit
+        
+        if limit <= 0:
+            limiter = None
+        else:
+            limiter = self._limiters.get(scope)
+            if limiter is None:
+                limiter = self._limiters[scope] = ConcurrencyLimiter(
+                    scope, limit, self.max_queue, self.queue_timeout
+                )
+        self._limiters[route] = limiter
+        return limiter
+
+    async def acquire(self, provider_name, model_name, priority=0):
+        limiter = self.limiter_for(provider_name, model_name)
+        if limiter is None:
+            return NO_LIMIT
+        return await limiter.acquire(priority)
+
+    def try_acquire(self, provider_name, model_name):
+        limiter = self.limiter_for(provider_name, model_name)
+        if limiter is None:
+            return NO_LIMIT
+        return limiter.try_acquire()
+
+
+admission = AdmissionController(
+    limits=settings.ADMISSION_LIMITS,
+    default_limit=settings.ADMISSION_DEFAULT_LIMIT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    priority_claim=settings.ADMISSION_PRIORITY_CLAIM
+)
@@ -0,0 +1,105 @@
+from config import settings
+from metrics.middleware import CONTEXT_PREFLIGHT
+from tokenization.service import tokenizer
+
+
+POLICIES = ("off", "reject", "drop_oldest", "keep_last")
+
+# A cl100k token is at least one byte of UTF-8 and a character at most four,
+# so prompts under this bound fit without being tokenized
+MAX_BYTES_PER_CHAR = 4
+
+
+class ContextWindowExceeded(Exception):
+    
+    def __init__(self, model, window, prompt_tokens, max_tokens):
+        super().__init__(
+            f"Prompt is {prompt_tokens} tokens and max_tokens is {max_tokens}, which exceeds "
+            f"the {window} token context window of {model}"
+        )
+        self.model = model
+        self.window = window
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+
+
+def upper_bound_tokens(messages):
+    total = 0
+    for message in messages:
+        # Counted as "role: content", the same text the tokenizer sees
+        text_length = len(message.role) + 2 + len(message.content)
+        if message.content.isascii() and message.role.isascii():
+            total += text_length
+        else:
+            total += text_length * MAX_BYTES_PER_CHAR
+    return total
+
+
+class ContextPreflight:
+    """Checks prompt plus max_tokens against the model's context window
+    before anything goes upstream, and either rejects the request or drops
+    conversation turns until it fits, depending on the policy"""
+
+    def __init__(self, policy, keep_last):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown context policy '{policy}', expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.keep_last = keep_last
+
+    async def check(self, provider_name, model_name, window, messages, max_tokens):
+        """Returns the messages to send, compacted if the policy allows it"""
+        if self.policy == "off" or not window or not tokenizer.available:
+            return messages
+        
+        budget = window - (max_tokens or 0)
+        if upper_bound_tokens(messages) <= budget:
+            return messages
+        
+        counts = await tokenizer.message_counts(
+            [{"role": message.role, "content": message.content} for message in messages]
+        )
+        prompt_tokens = sum(counts)
+        if prompt_tokens <= budget:
+            return messages
+        
+        kept = None if self.policy == "reject" else self.compact(messages, counts, budget)
+        if kept is None:
+            CONTEXT_PREFLIGHT.labels(provider=provider_name, model=model_name, action="rejected").inc()
+            raise ContextWindowExceeded(f"{provider_name}/{model_name}", window, prompt_tokens, max_tokens)
+        
+        CONTEXT_PREFLIGHT.labels(provider=provider_name, model=model_name, action="compacted").inc()
+        return [messages[i] for i in kept]
+
+    def compact(self, messages, counts, budget):
+        """Indexes of the messages to keep in order, or None if nothing the
+        policy allows fits. System messages and the latest turn always stay"""
+        system = [i for i, message in enumerate(messages) if message.role == "system"]
+        turns = [i for i, message in enumerate(messages) if message.role != "system"]
+        if not turns:
+            return None
+        
+        dropped = 0
+        if self.policy == "keep_last":
+            dropped = max(0, len(turns) - max(1, self.keep_last))
+        
+        total = sum(counts[i] for i in system) + sum(counts[i] for i in turns[dropped:])
+        if self.policy == "drop_oldest":
+            while total > budget and dropped < len(turns) - 1:
+                total -= counts[turns[dropped]]
+                dropped += 1
+        
+        # Once turns are dropped the conversation must still open with a
+        # user turn; Anthropic rejects one that starts with the assistant
+        while dropped and dropped < len(turns) - 1 and messages[turns[dropped]].role != "user":
+            total -= counts[turns[dropped]]
+            dropped += 1
+        
+        if total > budget or (dropped and messages[turns[dropped]].role != "user"):
+            return None
+        return sorted(system + turns[dropped:])
+
+
+context_preflight = ContextPreflight(
+    policy=settings.CONTEXT_POLICY,
+    keep_last=settings.CONTEXT_KEEP_LAST
+)
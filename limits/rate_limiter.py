@@ -0,0 +1,158 @@
+import math
+import time
+from collections import OrderedDict
+
+from config import settings
+from metrics.middleware import RATE_LIMIT_REJECTIONS, RATE_LIMIT_TRACKED_KEYS
+
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_request_tokens(messages, max_tokens):
+    """Cheap upper-ish bound used to reserve budget before the call; the
+    reservation is settled against real usage afterwards"""
+    chars = sum(len(message.content) for message in messages)
+    return chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+
+class RateLimitExceeded(Exception):
+    
+    def __init__(self, limit, retry_after, headers):
+        super().__init__(f"Rate limit exceeded ({limit})")
+        self.limit = limit
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken; a request larger than the
+        bucket is let through once the bucket is full and leaves it in debt"""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def charge(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+
+class UserLimits:
+    __slots__ = ("tier", "requests", "tokens", "last_seen")
+
+    def __init__(self, tier, limits, now):
+        self.tier = tier
+        self.requests = TokenBucket(limits["requests_per_second"], limits["burst"], now)
+        self.tokens = TokenBucket(limits["tokens_per_minute"] / 60.0, limits["tokens_per_minute"], now)
+        self.last_seen = now
+
+
+class Reservation:
+    __slots__ = ("limits", "estimate", "settled")
+
+    def __init__(self, limits, estimate):
+        self.limits = limits
+        self.estimate = estimate
+        self.settled = False
+
+    def settle(self, actual_tokens):
+        if self.settled:
+            return
+        self.settled = True
+        self.limits.tokens.charge(actual_tokens - self.estimate, time.monotonic())
+
+
+class RateLimiter:
+    
+    def __init__(self, enabled, tiers, tier_claim, idle_ttl, max_keys):
+        self.enabled = enabled
+        self.tiers = tiers
+        self.tier_claim = tier_claim
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+
+    def limits_for(self, tier, route):
+        config = self.tiers.get(tier) or self.tiers["default"]
+        overrides = (config.get("models") or {}).get(route)
+        limits = {key: value for key, value in config.items() if key != "models"}
+        if overrides:
+            limits.update(overrides)
+        return limits
+
+    def acquire(self, user_id, claims, route, estimated_tokens):
+        if not self.enabled:
+            return None
+        
+        now = time.monotonic()
+        self._evict(now)
+        
+        tier = str((claims or {}).get(self.tier_claim) or "default")
+        key = (user_id, route)
+        entry = self._entries.get(key)
+        if entry is None or entry.tier != tier:
+            entry = UserLimits(tier, self.limits_for(tier, route), now)
+            self._entries[key] = entry
+            RATE_LIMIT_TRACKED_KEYS.set(len(self._entries))
+        self._entries.move_to_end(key)
+        entry.last_seen = now
+        
+        request_wait = entry.requests.wait_time(1, now)
+        token_wait = entry.tokens.wait_time(estimated_tokens, now)
+        if request_wait or token_wait:
+            limit = "requests" if request_wait >= token_wait else "tokens"
+            RATE_LIMIT_REJECTIONS.labels(model=route, limit=limit).inc()
+            retry_after = max(request_wait, token_wait)
+            raise RateLimitExceeded(limit, retry_after, self._headers(entry, retry_after))
+        
+        entry.requests.charge(1, now)
+        entry.tokens.charge(estimated_tokens, now)
+        return Reservation(entry, estimated_tokens)
+
+    def _headers(self, entry, retry_after):
+        return {
+            "Retry-After": str(max(1, math.ceil(retry_after))),
+            "X-RateLimit-Limit-Requests": str(int(entry.requests.capacity)),
+            "X-RateLimit-Remaining-Requests": str(max(0, int(entry.requests.tokens))),
+            "X-RateLimit-Limit-Tokens": str(int(entry.tokens.capacity)),
+            "X-RateLimit-Remaining-Tokens": str(max(0, int(entry.tokens.tokens))),
+            "X-RateLimit-Reset": f"{retry_after:.3f}"
+        }
+
+    def _evict(self, now):
+        # Entries are kept in last-seen order, so idle ones sit at the front
+        # and each is popped at most once
+        entries = self._entries
+        evicted = False
+        while entries:
+            entry = next(iter(entries.values()))
+            if now - entry.last_seen < self.idle_ttl and len(entries) < self.max_keys:
+                break
+            entries.popitem(last=False)
+            evicted = True
+        if evicted:
+            RATE_LIMIT_TRACKED_KEYS.set(len(entries))
+
+
+rate_limiter = RateLimiter(
+    enabled=settings.RATE_LIMIT_ENABLED,
+    tiers=settings.RATE_LIMIT_TIERS,
+    tier_claim=settings.RATE_LIMIT_TIER_CLAIM,
+    idle_ttl=settings.RATE_LIMIT_IDLE_TTL,
+    max_keys=settings.RATE_LIMIT_MAX_KEYS
+)
@@ -1,8 +1,12 @@
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import Request
+from prometheus_client import (
+    Counter, Histogram, Gauge, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+)
 from fastapi.responses import Response as FastAPIResponse
+import os
 import time
 
+from config import settings
+
 
 REQUEST_COUNT = Counter(
     "llm_requests_total",
@@ -32,7 +36,8 @@ REQUEST_LATENCY = Histogram(
 ACTIVE_REQUESTS = Gauge(
     "llm_active_requests",
     "Number of active requests",
-    ["provider", "model"]
+    ["provider", "model"],
+    multiprocess_mode="livesum"
 )
 
 ERROR_COUNT = Counter(
@@ -41,43 +46,399 @@ ERROR_COUNT = Counter(
     ["provider", "model", "error_type"]
 )
 
+JWT_CACHE_HITS = Counter(
+    "jwt_cache_hits_total",
+    "Verified JWT cache hits"
+)
 
-async def metrics_middleware(request: Request, call_next):
-    
-    if request.url.path == "/metrics":
-        metrics = generate_latest()
-        return FastAPIResponse(content=metrics, media_type=CONTENT_TYPE_LATEST)
-    
-    if not request.url.path.startswith("/v1/"):
-        return await call_next(request)
-    
-    provider = getattr(request.state, "provider", "unknown")
-    model = getattr(request.state, "model", "unknown")
-    
-    ACTIVE_REQUESTS.labels(provider=provider, model=model).inc()
+JWT_CACHE_MISSES = Counter(
+    "jwt_cache_misses_total",
+    "Verified JWT cache misses"
+)
+
+JWT_CACHE_EVICTIONS = Counter(
+    "jwt_cache_evictions_total",
+    "Verified JWT cache entries evicted to stay within size"
+)
+
+TOKENIZER_QUEUE_DEPTH = Gauge(
+    "tokenizer_queue_depth",
+    "Texts waiting for or being encoded by the tokenizer pool",
+    multiprocess_mode="livesum"
+)
+
+TOKENIZER_ENCODE_SECONDS = Histogram(
+    "tokenizer_encode_seconds",
+    "Time spent encoding text into tokens",
+    ["mode"],
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5]
+)
+
+MESSAGE_TOKEN_CACHE_HITS = Counter(
+    "message_token_cache_hits_total",
+    "Per-message token count cache hits"
+)
+
+MESSAGE_TOKEN_CACHE_MISSES = Counter(
+    "message_token_cache_misses_total",
+    "Per-message token count cache misses"
+)
+
+MESSAGE_TOKEN_CACHE_EVICTIONS = Counter(
+    "message_token_cache_evictions_total",
+    "Per-message token counts evicted to stay within the memory budget"
+)
+
+MESSAGE_TOKEN_CACHE_BYTES = Gauge(
+    "message_token_cache_bytes",
+    "Estimated memory used by the per-message token count cache",
+    multiprocess_mode="livesum"
+)
+
+RESPONSE_CACHE_HITS = Counter(
+    "response_cache_hits_total",
+    "Chat completions served from the response cache"
+)
+
+RESPONSE_CACHE_MISSES = Counter(
+    "response_cache_misses_total",
+    "Cacheable chat completions not found in the response cache"
+)
+
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "response_cache_evictions_total",
+    "Response cache entries evicted to stay within the byte budget"
+)
+
+RESPONSE_CACHE_BYTES = Gauge(
+    "response_cache_bytes",
+    "Bytes held by the response cache",
+    multiprocess_mode="livesum"
+)
+
+SINGLE_FLIGHT_COALESCED = Counter(
+    "single_flight_coalesced_total",
+    "Requests served by joining an identical in-flight upstream request",
+    ["kind"]
+)
+
+UPSTREAM_IN_FLIGHT = Gauge(
+    "llm_upstream_in_flight",
+    "Requests in flight per upstream target",
+    ["provider", "target"],
+    multiprocess_mode="livesum"
+)
+
+UPSTREAM_ERRORS = Counter(
+    "llm_upstream_errors_total",
+    "Upstream 429/5xx responses and transport errors per target",
+    ["provider", "target", "status"]
+)
+
+UPSTREAM_EJECTED = Gauge(
+    "llm_upstream_ejected",
+    "Whether an upstream target is currently ejected (1) or serving (0)",
+    ["provider", "target"],
+    multiprocess_mode="livemax"
+)
+
+RETRY_ATTEMPTS = Counter(
+    "llm_retries_total",
+    "Upstream calls retried after a retryable failure",
+    ["provider", "model", "reason"]
+)
+
+CIRCUIT_STATE = Gauge(
+    "llm_circuit_state",
+    "Circuit breaker state per provider/model (0 closed, 1 half-open, 2 open)",
+    ["provider", "model"],
+    multiprocess_mode="livemax"
+)
+
+CIRCUIT_REJECTIONS = Counter(
+    "llm_circuit_rejections_total",
+    "Requests failed fast because the circuit was open",
+    ["provider", "model"]
+)
+
+HEDGES_FIRED = Counter(
+    "llm_hedges_fired_total",
+    "Fallback candidates started, by trigger (delay or failure)",
+    ["provider", "model", "reason"]
+)
+
+HEDGE_WINS = Counter(
+    "llm_hedge_wins_total",
+    "Requests answered by a fallback candidate instead of the requested model",
+    ["provider", "model"]
+)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "llm_rate_limit_rejections_total",
+    "Requests rejected by per-user rate limits",
+    ["model", "limit"]
+)
+
+RATE_LIMIT_TRACKED_KEYS = Gauge(
+    "llm_rate_limit_tracked_keys",
+    "User/model pairs currently holding rate limit state",
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "llm_admission_in_flight",
+    "Upstream calls holding an admission slot",
+    ["scope"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "llm_admission_queue_depth",
+    "Requests waiting for an admission slot",
+    ["scope"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    "llm_admission_wait_seconds",
+    "Time spent waiting for an admission slot",
+    ["scope"],
+    buckets=[0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+)
+
+ADMISSION_SHED = Counter(
+    "llm_admission_shed_total",
+    "Requests rejected by admission control",
+    ["scope", "reason"]
+)
+
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from request arrival to the first streamed chunk",
+    ["provider", "model"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0]
+)
+
+INTER_CHUNK_LATENCY = Histogram(
+    "llm_inter_chunk_latency_seconds",
+    "Gap between consecutive chunks of a stream",
+    ["provider", "model"],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+STREAM_DURATION = Histogram(
+    "llm_stream_duration_seconds",
+    "Time from request arrival to the end of the stream",
+    ["provider", "model"],
+    buckets=[0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]
+)
+
+OUTPUT_TOKENS_PER_SECOND = Histogram(
+    "llm_output_tokens_per_second",
+    "Output tokens per second between the first and last chunk",
+    ["provider", "model"],
+    buckets=[1, 5, 10, 25, 50, 100, 200, 500]
+)
+
+GATEWAY_OVERHEAD = Histogram(
+    "llm_gateway_overhead_seconds",
+    "Time spent in the gateway itself, excluding waiting on the upstream",
+    ["provider", "model"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25]
+)
+
+BATCH_ITEMS = Counter(
+    "llm_batch_items_total",
+    "Requests processed through the batch endpoint",
+    ["provider", "model", "status"]
+)
+
+CLIENT_CANCELLATIONS = Counter(
+    "llm_client_cancellations_total",
+    "Requests abandoned by the client before completion, whose upstream call was cancelled",
+    ["provider", "model", "kind"]
+)
+
+CONTEXT_PREFLIGHT = Counter(
+    "llm_context_preflight_total",
+    "Requests that did not fit the model's context window, by what was done about it",
+    ["provider", "model", "action"]
+)
+
+ROUTING_TABLE_RELOADS = Counter(
+    "routing_table_reloads_total",
+    "Routing table reloads after the file changed, by outcome",
+    ["outcome"]
+)
+
+ROUTING_DECISIONS = Counter(
+    "llm_routing_decisions_total",
+    "Model group requests by the candidate chosen and why (score, probe of a candidate without recent stats, "
+    "or fallback when none could be scored)",
+    ["group", "provider", "model", "reason"]
+)
+
+USAGE_LEDGER_RECORDS = Counter(
+    "usage_ledger_records_total",
+    "Usage ledger records by outcome (written, dropped when the queue is full, failed to write)",
+    ["outcome"]
+)
+
+USAGE_LEDGER_QUEUE_DEPTH = Gauge(
+    "usage_ledger_queue_depth",
+    "Usage ledger records waiting to be written",
+    multiprocess_mode="livesum"
+)
+
+
+# Under multiple workers serve.py aggregates every worker's metrics on
+# PROMETHEUS_PORT; the API port only serves them in single-process mode
+SERVE_METRICS = not os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+class LatencyMetrics:
+    """Label children for one provider/model, bound once"""
+
+    def __init__(self, provider, model):
+        self.ttft = TIME_TO_FIRST_TOKEN.labels(provider=provider, model=model)
+        self.inter_chunk = INTER_CHUNK_LATENCY.labels(provider=provider, model=model)
+        self.duration = STREAM_DURATION.labels(provider=provider, model=model)
+        self.tokens_per_second = OUTPUT_TOKENS_PER_SECOND.labels(provider=provider, model=model)
+        self.overhead = GATEWAY_OVERHEAD.labels(provider=provider, model=model)
+        self.stats = upstream_stats(provider, model)
+
+
+class UpstreamStats:
+    """Moving averages of one provider/model, fed alongside the histograms
+    and read by adaptive routing. Process-local, unlike the histograms"""
     
-    start_time = time.time()
-    status = "success"
+    __slots__ = ("ttft", "throughput", "error_rate", "in_flight", "updated_at")
+
+    def __init__(self):
+        self.ttft = None
+        self.throughput = None
+        self.error_rate = None
+        self.in_flight = 0
+        self.updated_at = None
+
+    def record_ttft(self, seconds):
+        self._refresh()
+        self.ttft = ewma(self.ttft, seconds)
+
+    def record_throughput(self, tokens_per_second):
+        self._refresh()
+        self.throughput = ewma(self.throughput, tokens_per_second)
+
+    def record_outcome(self, failed):
+        self._refresh()
+        self.error_rate = ewma(self.error_rate, 1.0 if failed else 0.0)
+
+    def _refresh(self):
+        # Averages from before a quiet spell say little about the upstream
+        # now, so the next samples start them over
+        now = time.monotonic()
+        if self.updated_at is not None and now - self.updated_at > settings.ROUTING_PROBE_INTERVAL:
+            self.ttft = self.throughput = self.error_rate = None
+        self.updated_at = now
+
+
+def ewma(current, sample):
+    if current is None:
+        return sample
+    return current + settings.ROUTING_EWMA_ALPHA * (sample - current)
+
+
+_latency_metrics = {}
+_upstream_stats = {}
+
+
+def latency_metrics(provider, model):
+    metrics = _latency_metrics.get((provider, model))
+    if metrics is None:
+        metrics = _latency_metrics[(provider, model)] = LatencyMetrics(provider, model)
+    return metrics
+
+
+def upstream_stats(provider, model):
+    stats = _upstream_stats.get((provider, model))
+    if stats is None:
+        stats = _upstream_stats[(provider, model)] = UpstreamStats()
+    return stats
+
+
+def track_request(state, provider, model):
+    """Called by the router once the route is known, so the middleware can
+    label the request with the real provider/model"""
+    state.provider = provider
+    state.model = model
+    state.active_requests = ACTIVE_REQUESTS.labels(provider=provider, model=model)
+    state.active_requests.inc()
+    state.upstream_stats = upstream_stats(provider, model)
+    state.upstream_stats.in_flight += 1
+
+
+class MetricsMiddleware:
     
-    try:
-        response = await call_next(request)
+    def __init__(self, app, ledger=None):
+        self.app = app
+        self.ledger = ledger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
         
-        if response.status_code >= 400:
-            status = "error"
+        path = scope["path"]
         
-        return response
+        if path == "/metrics" and SERVE_METRICS:
+            metrics = generate_latest(REGISTRY)
+            response = FastAPIResponse(content=metrics, media_type=CONTENT_TYPE_LATEST)
+            return await response(scope, receive, send)
         
-    except Exception as e:
-        status = "error"
-        error_type = type(e).__name__
-        ERROR_COUNT.labels(provider=provider, model=model, error_type=error_type).inc()
-        raise
+        if not path.startswith("/v1/"):
+            return await self.app(scope, receive, send)
+        
+        state = scope.setdefault("state", {})
+        start_time = time.perf_counter()
+        state["received_at"] = start_time
+        status = "success"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if status_code >= 400:
+                    status = "error"
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        
+        except Exception as e:
+            status = "error"
+            error_type = type(e).__name__
+            ERROR_COUNT.labels(
+                provider=state.get("provider", "unknown"),
+                model=state.get("model", "unknown"),
+                error_type=error_type
+            ).inc()
+            raise
         
-    finally:
-        duration = time.time() - start_time
-        REQUEST_COUNT.labels(provider=provider, model=model, status=status).inc()
-        REQUEST_LATENCY.labels(provider=provider, model=model).observe(duration)
-        ACTIVE_REQUESTS.labels(provider=provider, model=model).dec()
+        finally:
+            duration = time.perf_counter() - start_time
+            provider = state.get("provider", "unknown")
+            model = state.get("model", "unknown")
+            REQUEST_COUNT.labels(provider=provider, model=model, status=status).inc()
+            REQUEST_LATENCY.labels(provider=provider, model=model).observe(duration)
+            active_requests = state.get("active_requests")
+            if active_requests is not None:
+                active_requests.dec()
+                state["upstream_stats"].in_flight -= 1
+                # Only model requests are billed; batches and abandoned
+                # calls write their own records
+                if self.ledger is not None and not state.get("usage_recorded"):
+                    self.ledger.record_request(state, status_code, duration)
 
 
 def record_token_usage(provider, model, input_tokens, output_tokens):
@@ -1,12 +1,101 @@
+import asyncio
+import httpx
+import orjson
 from abc import ABC, abstractmethod
+from config import settings
+from registry.upstream_pool import UpstreamPool
+
+
+def build_http_client():
+    return httpx.AsyncClient(
+        http2=settings.UPSTREAM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+            read=settings.UPSTREAM_READ_TIMEOUT,
+            write=settings.UPSTREAM_WRITE_TIMEOUT,
+            pool=settings.UPSTREAM_POOL_TIMEOUT
+        )
+    )
+
+
+def build_upstream_pool(provider, targets):
+    return UpstreamPool(
+        provider,
+        targets,
+        strategy=settings.UPSTREAM_BALANCING,
+        failure_threshold=settings.UPSTREAM_EJECTION_THRESHOLD,
+        cooldown=settings.UPSTREAM_EJECTION_COOLDOWN
+    )
+
+
+class RawResponse:
+    """Upstream JSON body kept as the bytes we received, so it can be
+    forwarded untouched; parsed only if something needs the fields"""
+    
+    __slots__ = ("body", "_data")
+
+    def __init__(self, body):
+        self.body = body
+        self._data = None
+
+    def json(self):
+        if self._data is None:
+            self._data = orjson.loads(self.body)
+        return self._data
 
 
 class BaseProvider(ABC):
     
+    client = None
+    schema = None
+    reports_stream_usage = False
+
+    async def startup(self):
+        if self.client is None:
+            self.client = build_http_client()
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def warmup(self):
+        client = self.get_client()
+
+        async def open_connection(url):
+            try:
+                await client.head(url)
+            except httpx.HTTPError:
+                pass
+        
+        await asyncio.gather(*[
+            open_connection(target.url)
+            for target in self.pool.targets
+            for _ in range(settings.PROVIDER_WARMUP_CONNECTIONS)
+        ])
+        await self.load_tokenizer()
+
+    async def load_tokenizer(self):
+        pass
+
+    def get_client(self):
+        if self.client is None:
+            raise RuntimeError(f"{type(self).__name__} is not started")
+        return self.client
+    
     @abstractmethod
     async def generate(self, payload, stream):
         pass
 
+    @abstractmethod
+    def stream_from_response(self, response):
+        pass
+
     @abstractmethod
     async def count_tokens(self, input_text, output_text):
         pass
@@ -1,13 +1,20 @@
-import httpx
 import os
-from providers.base import BaseProvider
+import orjson
+from config import settings
+from providers.base import BaseProvider, RawResponse, build_upstream_pool
+from streaming.sse import iter_sse, sse_chunk
 
 
 class ClaudeProvider(BaseProvider):
     
-    def __init__(self):
-        self.api_key = os.getenv("ANTHROPIC_API_KEY")
-        self.base_url = "https://api.anthropic.com/v1/messages"
+    schema = "anthropic"
+    reports_stream_usage = True
+    
+    def __init__(self, targets=None):
+        self.default_targets = targets or settings.CLAUDE_TARGETS or [
+            {"url": settings.CLAUDE_BASE_URL, "api_key": os.getenv("ANTHROPIC_API_KEY")}
+        ]
+        self.pool = build_upstream_pool("claude", self.default_targets)
         
         self.capabilities = {
             "claude-3-opus": {"max_tokens": 200000},
@@ -17,22 +24,23 @@ class ClaudeProvider(BaseProvider):
 
     async def generate(self, payload, stream):
         
-        if not self.api_key:
+        target = self.pool.select()
+        if not target.api_key:
             raise ValueError("ANTHROPIC_API_KEY not set")
         
         headers = {
-            "x-api-key": self.api_key,
+            "x-api-key": target.api_key,
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01"
         }
         
         claude_payload = self._convert_to_claude_format(payload)
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            if stream:
-                return await self._handle_streaming(client, headers, claude_payload)
-            else:
-                return await self._handle_non_streaming(client, headers, claude_payload)
+        client = self.get_client()
+        if stream:
+            return self._handle_streaming(client, target, headers, claude_payload)
+        else:
+            return await self._handle_non_streaming(client, target, headers, claude_payload)
 
     def _convert_to_claude_format(self, payload):
         return {
@@ -43,19 +51,48 @@ class ClaudeProvider(BaseProvider):
             "stream": payload.get("stream", False)
         }
 
-    async def _handle_non_streaming(self, client, headers, payload):
-        response = await client.post(self.base_url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-
-    async def _handle_streaming(self, client, headers, payload):
-        async with client.stream("POST", self.base_url, headers=headers, json=payload) as response:
+    async def _handle_non_streaming(self, client, target, headers, payload):
+        with self.pool.track(target):
+            response = await client.post(target.url, headers=headers, content=orjson.dumps(payload))
             response.raise_for_status()
-            
-            async for line in response.aiter_lines():
-                if line.strip() and line.startswith("data: "):
-                    data = line[6:]
-                    yield data.encode() + b"\n\n"
+            return RawResponse(response.content)
+
+    async def _handle_streaming(self, client, target, headers, payload):
+        with self.pool.track(target):
+            async with client.stream("POST", target.url, headers=headers, content=orjson.dumps(payload)) as response:
+                response.raise_for_status()
+                
+                async for frames in iter_sse(response):
+                    yield frames
+
+    async def stream_from_response(self, response):
+        usage = response.get("usage", {})
+        
+        yield sse_chunk({"type": "message_start", "message": {
+            "id": response.get("id"),
+            "type": "message",
+            "role": response.get("role", "assistant"),
+            "model": response.get("model"),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": usage.get("input_tokens", 0), "output_tokens": 0}
+        }}, "message_start")
+        
+        for index, block in enumerate(response.get("content", [])):
+            if block.get("type") != "text":
+                continue
+            yield sse_chunk({"type": "content_block_start", "index": index,
+                             "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            yield sse_chunk({"type": "content_block_delta", "index": index,
+                             "delta": {"type": "text_delta", "text": block.get("text", "")}}, "content_block_delta")
+            yield sse_chunk({"type": "content_block_stop", "index": index}, "content_block_stop")
+        
+        yield sse_chunk({"type": "message_delta",
+                         "delta": {"stop_reason": response.get("stop_reason"),
+                                   "stop_sequence": response.get("stop_sequence")},
+                         "usage": {"output_tokens": usage.get("output_tokens", 0)}}, "message_delta")
+        yield sse_chunk({"type": "message_stop"}, "message_stop")
 
     async def count_tokens(self, input_text, output_text):
         input_tokens = len(input_text) * 10 // 35
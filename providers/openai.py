@@ -1,58 +1,97 @@
-import httpx
+import asyncio
 import os
-from providers.base import BaseProvider
+import orjson
+import tiktoken
+from config import settings
+from providers.base import BaseProvider, RawResponse, build_upstream_pool
+from streaming.sse import iter_sse, sse_chunk
 
 
 class OpenAIProvider(BaseProvider):
     
-    def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.base_url = "https://api.openai.com/v1/chat/completions"
+    schema = "openai"
+    reports_stream_usage = True
+    
+    def __init__(self, targets=None):
+        self.default_targets = targets or settings.OPENAI_TARGETS or [
+            {"url": settings.OPENAI_BASE_URL, "api_key": os.getenv("OPENAI_API_KEY")}
+        ]
+        self.pool = build_upstream_pool("openai", self.default_targets)
         
         self.capabilities = {
             "gpt-4": {"max_tokens": 8192},
             "gpt-4-turbo": {"max_tokens": 128000},
             "gpt-3.5-turbo": {"max_tokens": 4096}
         }
+        
+        self.encoding = None
 
     async def generate(self, payload, stream):
         
-        if not self.api_key:
+        target = self.pool.select()
+        if not target.api_key:
             raise ValueError("OPENAI_API_KEY not set")
         
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {target.api_key}",
             "Content-Type": "application/json"
         }
         
         if stream:
             payload["stream_options"] = {"include_usage": True}
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            if stream:
-                return await self._handle_streaming(client, headers, payload)
-            else:
-                return await self._handle_non_streaming(client, headers, payload)
-
-    async def _handle_non_streaming(self, client, headers, payload):
-        response = await client.post(self.base_url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+        client = self.get_client()
+        if stream:
+            return self._handle_streaming(client, target, headers, payload)
+        else:
+            return await self._handle_non_streaming(client, target, headers, payload)
 
-    async def _handle_streaming(self, client, headers, payload):
-        async with client.stream("POST", self.base_url, headers=headers, json=payload) as response:
+    async def _handle_non_streaming(self, client, target, headers, payload):
+        with self.pool.track(target):
+            response = await client.post(target.url, headers=headers, content=orjson.dumps(payload))
             response.raise_for_status()
-            
-            async for line in response.aiter_lines():
-                if line.strip() and line.startswith("data: "):
-                    data = line[6:]
-                    if data.strip() == "[DONE]":
-                        break
-                    yield data.encode() + b"\n\n"
+            return RawResponse(response.content)
+
+    async def _handle_streaming(self, client, target, headers, payload):
+        with self.pool.track(target):
+            async with client.stream("POST", target.url, headers=headers, content=orjson.dumps(payload)) as response:
+                response.raise_for_status()
+                
+                async for frames in iter_sse(response):
+                    yield frames
+
+    async def stream_from_response(self, response):
+        base = {
+            "id": response.get("id"),
+            "object": "chat.completion.chunk",
+            "created": response.get("created"),
+            "model": response.get("model")
+        }
+        
+        for choice in response.get("choices", []):
+            message = choice.get("message", {})
+            yield sse_chunk({**base, "choices": [{
+                "index": choice.get("index", 0),
+                "delta": {"role": message.get("role", "assistant"), "content": message.get("content")},
+                "finish_reason": None
+            }]})
+            yield sse_chunk({**base, "choices": [{
+                "index": choice.get("index", 0),
+                "delta": {},
+                "finish_reason": choice.get("finish_reason")
+            }]})
+        
+        if response.get("usage"):
+            yield sse_chunk({**base, "choices": [], "usage": response["usage"]})
+        yield b"data: [DONE]\n\n"
+
+    async def load_tokenizer(self):
+        if self.encoding is None:
+            self.encoding = await asyncio.to_thread(tiktoken.get_encoding, "cl100k_base")
 
     async def count_tokens(self, input_text, output_text):
-        import tiktoken
-        encoding = tiktoken.get_encoding("cl100k_base")
+        await self.load_tokenizer()
+        encoding = self.encoding
         input_tokens = len(encoding.encode(input_text))
         output_tokens = len(encoding.encode(output_text or ""))
         return input_tokens, output_tokens
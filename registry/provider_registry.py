@@ -1,26 +1,123 @@
+import asyncio
+import logging
+import time
 from providers.base import BaseProvider
+from config import settings
+from metrics.middleware import upstream_stats, ROUTING_DECISIONS
+from resilience.circuit_breaker import CLOSED
+from resilience.retry import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+# Floor on 1 - error rate, so a failing upstream scores badly but finitely
+MIN_SUCCESS_RATE = 0.05
 
 
 class ProviderRegistry:
     
     def __init__(self):
         self.providers = {}
+        self.instances = {}
         self.model_capabilities = {}
+        self.ready = False
+        self._warmup_task = None
         self.auto_register_providers()
 
-    def register(self, name, provider_class, model_capabilities=None):
+    def register(self, name, provider_class, model_capabilities=None, targets=None):
         self.providers[name] = provider_class
+        self.instances[name] = provider_class(targets=targets) if targets else provider_class()
+        if model_capabilities is None:
+            model_capabilities = getattr(self.instances[name], "capabilities", None)
         if model_capabilities:
             self.model_capabilities[name] = model_capabilities
     
     def get(self, name):
         if name not in self.providers:
             raise ValueError(f"Provider '{name}' not supported")
-        return self.providers[name]
+        return self.instances[name]
     
     def list_providers(self):
         return list(self.providers.keys())
+
+    def select(self, group, input_tokens, output_tokens):
+        """Adaptive routing for a model group: the candidate with the lowest
+        score from its live upstream stats. Candidates with an open circuit
+        are skipped, and ones without recent stats or with a half-open
+        circuit are probed one request at a time, so a recovered upstream
+        gets traffic back"""
+        now = time.monotonic()
+        available = []
+        best = None
+        best_score = None
+        
+        for route in group.candidates:
+            breaker = circuit_breakers.get(route.provider_name, route.model_name)
+            if not breaker.available():
+                continue
+            available.append(route)
+            
+            stats = upstream_stats(route.provider_name, route.model_name)
+            stale = stats.updated_at is None or now - stats.updated_at > settings.ROUTING_PROBE_INTERVAL
+            if stale or breaker.state != CLOSED:
+                if stats.in_flight == 0:
+                    return self._choose(group, route, "probe")
+                continue
+            
+            score = route_score(route, stats, input_tokens, output_tokens, group.cost_weight)
+            if best_score is None or score < best_score:
+                best, best_score = route, score
+        
+        if best is None:
+            # Everything usable is already being probed; spread by load
+            best = min(available or group.candidates,
+                       key=lambda route: upstream_stats(route.provider_name, route.model_name).in_flight)
+            return self._choose(group, best, "fallback")
+        return self._choose(group, best, "score")
+
+    def _choose(self, group, route, reason):
+        ROUTING_DECISIONS.labels(
+            group=group.name, provider=route.provider_name, model=route.model_name, reason=reason
+        ).inc()
+        return route
     
+    async def startup(self, warmup=None):
+        if warmup is None:
+            warmup = settings.PROVIDER_WARMUP
+        
+        for provider in self.instances.values():
+            await provider.startup()
+        
+        if warmup:
+            self._warmup_task = asyncio.create_task(self.warmup())
+        else:
+            self.ready = True
+
+    async def warmup(self):
+        async def warm(name, provider):
+            try:
+                await asyncio.wait_for(provider.warmup(), settings.PROVIDER_WARMUP_TIMEOUT)
+            except Exception as e:
+                logger.warning("Warm-up for provider '%s' failed: %s", name, e)
+        
+        await asyncio.gather(*[
+            warm(name, provider) for name, provider in self.instances.items()
+        ])
+        self.ready = True
+
+    async def shutdown(self):
+        self.ready = False
+        
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+            try:
+                await self._warmup_task
+            except asyncio.CancelledError:
+                pass
+        self._warmup_task = None
+        
+        for provider in self.instances.values():
+            await provider.shutdown()
+
     def auto_register_providers(self):
         from providers.openai import OpenAIProvider
         from providers.claude import ClaudeProvider
@@ -29,4 +126,20 @@ class ProviderRegistry:
         self.register('claude', ClaudeProvider)
 
 
-# provider_registry = ProviderRegistry()
+def route_score(route, stats, input_tokens, output_tokens, cost_weight):
+    """Expected seconds to a full answer, each request already in flight
+    adding ROUTING_IN_FLIGHT_WEIGHT of it and failures inflating it by the
+    attempts they cost, plus the request's cost at cost_weight seconds per cent"""
+    expected = stats.ttft or 0.0
+    if stats.throughput:
+        expected += output_tokens / stats.throughput
+    expected *= 1 + stats.in_flight * settings.ROUTING_IN_FLIGHT_WEIGHT
+    expected /= max(MIN_SUCCESS_RATE, 1 - (stats.error_rate or 0.0))
+    
+    if route.cost:
+        input_cost, output_cost = route.cost
+        expected += cost_weight * 100 * (input_tokens * input_cost + output_tokens * output_cost)
+    return expected
+
+
+provider_registry = ProviderRegistry()
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+from collections import namedtuple
+from types import MappingProxyType
+
+import orjson
+
+from config import settings
+from metrics.middleware import ROUTING_TABLE_RELOADS
+from providers.base import build_upstream_pool
+from registry.provider_registry import provider_registry
+
+logger = logging.getLogger(__name__)
+
+
+SECTIONS = ("aliases", "models", "groups", "targets")
+DEFAULT_PARAMETERS = ("temperature", "max_tokens")
+EMPTY = MappingProxyType({})
+
+Route = namedtuple("Route", ["name", "provider_name", "model_name", "provider", "capabilities", "defaults", "cost"])
+ModelGroup = namedtuple("ModelGroup", ["name", "candidates", "cost_weight"])
+
+
+class RoutingTable:
+    """Read-only result of compiling the routing config: aliases and known
+    models map straight to their Route, and the /v1/models body is
+    serialised once. A reload builds a new table instead of changing this one"""
+
+    def __init__(self, routes, groups, targets, models_body):
+        self.routes = MappingProxyType(routes)
+        self.groups = MappingProxyType(groups)
+        self.targets = MappingProxyType(targets)
+        self.models_body = models_body
+
+    def resolve(self, model):
+        route = self.routes.get(model)
+        if route is not None:
+            return route
+        
+        # Models the table does not list still pass through to their provider
+        if "/" not in model:
+            raise ValueError("Model format should be 'provider/model-name' or a configured alias")
+        provider_name, model_name = model.split("/", 1)
+        return Route(model, provider_name, model_name, provider_registry.get(provider_name), EMPTY, EMPTY, None)
+
+
+def compile_routing_table(config, registry):
+    if not isinstance(config, dict):
+        raise ValueError("Routing table must be a JSON object")
+    unknown = set(config) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown routing table sections: {', '.join(sorted(unknown))}")
+    
+    capabilities = {
+        provider_name: {model_name: dict(values) for model_name, values in models.items()}
+        for provider_name, models in registry.model_capabilities.items()
+    }
+    defaults = {}
+    costs = {}
+    for name, entry in (config.get("models") or {}).items():
+        provider_name, model_name = split_route(name, registry)
+        capabilities.setdefault(provider_name, {}).setdefault(model_name, {}).update(entry.get("capabilities") or {})
+        
+        parameters = entry.get("defaults") or {}
+        invalid = set(parameters) - set(DEFAULT_PARAMETERS)
+        if invalid:
+            raise ValueError(f"Model '{name}' has unsupported defaults: {', '.join(sorted(invalid))}")
+        defaults[name] = MappingProxyType(dict(parameters))
+    
+        cost = entry.get("cost")
+        if cost is not None:
+            # Configured per million tokens, the way providers price
+            costs[name] = (cost.get("input", 0) / 1e6, cost.get("output", 0) / 1e6)
+    
+    routes = {}
+    for provider_name, models in capabilities.items():
+        provider = registry.get(provider_name)
+        for model_name, values in models.items():
+            name = f"{provider_name}/{model_name}"
+            routes[name] = Route(
+                name, provider_name, model_name, provider, MappingProxyType(values), defaults.get(name, EMPTY),
+                costs.get(name)
+            )
+    
+    # Aliases resolve against models only, so one can also reroute a real
+    # model name (e.g. during an incident) without chaining through others
+    aliases = config.get("aliases") or {}
+    resolved = {}
+    for alias, target in aliases.items():
+        resolved[alias] = routes.get(target) or unlisted_route(target, registry)
+    routes.update(resolved)
+    
+    groups = {}
+    for group_name, entry in (config.get("groups") or {}).items():
+        if group_name in routes:
+            raise ValueError(f"Group '{group_name}' has the name of a model or alias")
+        candidates = tuple(routes.get(name) or unlisted_route(name, registry) for name in entry.get("candidates") or [])
+        if not candidates:
+            raise ValueError(f"Group '{group_name}' has no candidates")
+        groups[group_name] = ModelGroup(group_name, candidates, entry.get("cost_weight", settings.ROUTING_COST_WEIGHT))
+    
+    targets = {}
+    for provider_name, provider_targets in (config.get("targets") or {}).items():
+        provider = registry.get(provider_name)
+        if not provider_targets:
+            raise ValueError(f"Provider '{provider_name}' has no upstream targets")
+        targets[provider_name] = [resolve_target(target, provider) for target in provider_targets]
+    
+    models_body = orjson.dumps({
+        "models": {provider_name: capabilities.get(provider_name, {}) for provider_name in registry.providers},
+        "aliases": aliases,
+        "groups": {group.name: [route.name for route in group.candidates] for group in groups.values()}
+    })
+    return RoutingTable(routes, groups, targets, models_body)
+
+
+def split_route(name, registry):
+    if "/" not in name:
+        raise ValueError(f"'{name}' should be 'provider/model-name'")
+    provider_name, model_name = name.split("/", 1)
+    registry.get(provider_name)
+    return provider_name, model_name
+
+
+def unlisted_route(name, registry):
+    provider_name, model_name = split_route(name, registry)
+    return Route(name, provider_name, model_name, registry.get(provider_name), EMPTY, EMPTY, None)
+
+
+def resolve_target(target, provider):
+    if "url" not in target:
+        raise ValueError(f"Upstream target {target} has no url")
+    resolved = {key: value for key, value in target.items() if key != "api_key_env"}
+    if "api_key_env" in target:
+        resolved["api_key"] = os.getenv(target["api_key_env"])
+    elif "api_key" not in target:
+        resolved["api_key"] = provider.default_targets[0].get("api_key")
+    return resolved
+
+
+class RoutingTableManager:
+    """Owns the current RoutingTable. The file is polled for changes and a
+    new table is compiled on the side; swapping it in, together with any
+    changed upstream pools, happens without yielding to the event loop, so
+    a request sees either the old config or the new one. A file that fails
+    to compile is logged and the current table stays"""
+
+    def __init__(self, path, reload_interval, registry):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.registry = registry
+        self.table = None
+        self._signature = None
+        self._task = None
+        
+        config = {}
+        if path:
+            self._signature = self._file_signature()
+            config = self._read()
+        self.apply(compile_routing_table(config, registry))
+
+    def apply(self, table):
+        pools = {}
+        for provider_name, provider in self.registry.instances.items():
+            targets = table.targets.get(provider_name)
+            current = self.table.targets.get(provider_name) if self.table else None
+            if targets != current:
+                pools[provider_name] = build_upstream_pool(provider_name, targets or provider.default_targets)
+        
+        # Nothing below can fail or yield
+        self.table = table
+        for provider_name, pool in pools.items():
+            self.registry.instances[provider_name].pool = pool
+
+    async def start(self):
+        if not self.path or self.reload_interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def reload(self):
+        try:
+            config = await asyncio.to_thread(self._read)
+            self.apply(compile_routing_table(config, self.registry))
+        except Exception as e:
+            logger.warning("Keeping the current routing table, %s could not be loaded: %s", self.path, e)
+            ROUTING_TABLE_RELOADS.labels(outcome="failed").inc()
+            return False
+        
+        logger.info("Reloaded routing table from %s (%d routes)", self.path, len(self.table.routes))
+        ROUTING_TABLE_RELOADS.labels(outcome="success").inc()
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            signature = self._file_signature()
+            # A deleted file keeps the table it last loaded
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            await self.reload()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            return orjson.loads(f.read())
+
+
+routing_table = RoutingTableManager(
+    path=settings.ROUTING_TABLE_PATH,
+    reload_interval=settings.ROUTING_TABLE_RELOAD_INTERVAL,
+    registry=provider_registry
+)
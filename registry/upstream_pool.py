@@ -0,0 +1,133 @@
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import httpx
+
+from metrics.middleware import UPSTREAM_IN_FLIGHT, UPSTREAM_ERRORS, UPSTREAM_EJECTED
+
+
+class UpstreamTarget:
+    
+    def __init__(self, provider, name, url, api_key, weight=1):
+        self.provider = provider
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.weight = max(float(weight), 0.01)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.current_weight = 0.0
+        self.in_flight_gauge = UPSTREAM_IN_FLIGHT.labels(provider=provider, target=name)
+        self.ejected_gauge = UPSTREAM_EJECTED.labels(provider=provider, target=name)
+
+
+class UpstreamPool:
+    
+    def __init__(self, provider, targets, strategy, failure_threshold, cooldown):
+        if strategy not in ("least_outstanding", "weighted"):
+            raise ValueError(f"Unknown upstream balancing strategy '{strategy}'")
+        if not targets:
+            raise ValueError(f"Provider '{provider}' has no upstream targets")
+        
+        self.provider = provider
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.targets = []
+        
+        for index, target in enumerate(targets):
+            url = target["url"]
+            name = target.get("name") or f"{urlparse(url).hostname}#{index}"
+            self.targets.append(UpstreamTarget(
+                provider, name, url, target.get("api_key"), target.get("weight", 1)
+            ))
+        
+        self._next = 0
+
+    def select(self):
+        now = time.monotonic()
+        candidates = []
+        for target in self.targets:
+            if target.ejected_until:
+                if target.ejected_until > now:
+                    continue
+                target.ejected_until = 0.0
+                target.ejected_gauge.set(0)
+            candidates.append(target)
+        
+        if not candidates:
+            return min(self.targets, key=lambda target: target.ejected_until)
+        
+        if self.strategy == "weighted":
+            return self._select_weighted(candidates)
+        return self._select_least_outstanding(candidates)
+
+    def _select_least_outstanding(self, candidates):
+        count = len(candidates)
+        start = self._next % count
+        self._next += 1
+        
+        best = None
+        for i in range(count):
+            target = candidates[(start + i) % count]
+            if best is None or target.in_flight / target.weight < best.in_flight / best.weight:
+                best = target
+        return best
+
+    def _select_weighted(self, candidates):
+        total = 0.0
+        best = None
+        for target in candidates:
+            target.current_weight += target.weight
+            total += target.weight
+            if best is None or target.current_weight > best.current_weight:
+                best = target
+        best.current_weight -= total
+        return best
+
+    @contextmanager
+    def track(self, target):
+        target.in_flight += 1
+        target.in_flight_gauge.inc()
+        try:
+            yield target
+        except httpx.HTTPStatusError as e:
+            self._record_failure(target, e.response)
+            raise
+        except httpx.TransportError:
+            self._record_failure(target, None)
+            raise
+        else:
+            target.consecutive_failures = 0
+        finally:
+            target.in_flight -= 1
+            target.in_flight_gauge.dec()
+
+    def _record_failure(self, target, response):
+        status = response.status_code if response is not None else None
+        if status is not None and status != 429 and status < 500:
+            return
+        
+        UPSTREAM_ERRORS.labels(
+            provider=self.provider, target=target.name, status=str(status or "transport")
+        ).inc()
+        target.consecutive_failures += 1
+        
+        if status == 429:
+            self.eject(target, retry_after(response) or self.cooldown)
+        elif target.consecutive_failures >= self.failure_threshold:
+            self.eject(target, self.cooldown)
+
+    def eject(self, target, duration):
+        target.ejected_until = time.monotonic() + duration
+        target.consecutive_failures = 0
+        target.ejected_gauge.set(1)
+
+def retry_after(response):
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,94 @@
+import time
+
+from metrics.middleware import CIRCUIT_STATE, CIRCUIT_REJECTIONS
+
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    
+    def __init__(self, provider, model, retry_after):
+        super().__init__(f"Circuit open for {provider}/{model}")
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    
+    def __init__(self, provider, model, failure_threshold, reset_timeout):
+        self.provider = provider
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._state_gauge = CIRCUIT_STATE.labels(provider=provider, model=model)
+        self._rejections = CIRCUIT_REJECTIONS.labels(provider=provider, model=model)
+
+    def check(self):
+        if self.state == CLOSED:
+            return
+        
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self._rejections.inc()
+                raise CircuitOpenError(self.provider, self.model, remaining)
+            self._set_state(HALF_OPEN)
+        
+        if self.probe_in_flight:
+            self._rejections.inc()
+            raise CircuitOpenError(self.provider, self.model, self.reset_timeout)
+        self.probe_in_flight = True
+
+    def available(self):
+        """Whether check() would let a call through, without claiming the
+        half-open probe"""
+        if self.state == OPEN and self.opened_at + self.reset_timeout > time.monotonic():
+            return False
+        return self.state == CLOSED or not self.probe_in_flight
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.probe_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.failures = 0
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def release(self):
+        self.probe_in_flight = False
+
+    def _set_state(self, state):
+        self.state = state
+        self._state_gauge.set(STATE_VALUES[state])
+
+
+class CircuitBreakerRegistry:
+    
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def get(self, provider, model):
+        key = (provider, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(provider, model, self.failure_threshold, self.reset_timeout)
+            self._breakers[key] = breaker
+        return breaker
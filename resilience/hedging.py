@@ -0,0 +1,205 @@
+import asyncio
+import time
+import weakref
+from collections import deque
+
+from config import settings
+from limits.admission import admission, NO_LIMIT
+from metrics.middleware import HEDGES_FIRED, HEDGE_WINS
+from resilience.retry import resilient_generate
+from streaming.normalize import normalize_response, normalize_stream
+
+
+TTFT_WINDOW_SIZE = 256
+MIN_TTFT_SAMPLES = 20
+PERCENTILE_REFRESH_INTERVAL = 16
+
+
+class TTFTWindow:
+    
+    def __init__(self, size=TTFT_WINDOW_SIZE):
+        self.samples = deque(maxlen=size)
+        self._value = None
+        self._since_refresh = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self._since_refresh += 1
+
+    def percentile(self, q):
+        if len(self.samples) < MIN_TTFT_SAMPLES:
+            return None
+        if self._value is None or self._since_refresh >= PERCENTILE_REFRESH_INTERVAL:
+            ordered = sorted(self.samples)
+            self._value = ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+            self._since_refresh = 0
+        return self._value
+
+
+class Hedger:
+    
+    def __init__(self, chains, delay, mode, percentile, min_delay):
+        self.chains = {
+            route: [tuple(fallback.split("/", 1)) for fallback in fallbacks if "/" in fallback]
+            for route, fallbacks in chains.items()
+        }
+        self.delay = delay
+        self.mode = mode
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.windows = {}
+
+    def fallbacks_for(self, provider_name, model_name):
+        return self.chains.get(f"{provider_name}/{model_name}", [])
+
+    def record_ttft(self, provider_name, model_name, seconds):
+        key = (provider_name, model_name)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = TTFTWindow()
+        window.record(seconds)
+
+    def delay_for(self, provider_name, model_name):
+        if self.mode == "percentile":
+            window = self.windows.get((provider_name, model_name))
+            observed = window.percentile(self.percentile) if window else None
+            if observed is not None:
+                return min(self.delay, max(self.min_delay, observed))
+        return self.delay
+
+    async def generate(self, candidates, payload, stream):
+        """Race the candidates, starting the next one whenever the current
+        ones are slower than the hedge delay or fail. Returns the winning
+        candidate and its result in the first candidate's schema."""
+        primary_name, primary_model, primary = candidates[0]
+        pending = {}
+        errors = {}
+        launched = 0
+
+        def launch(reason):
+            nonlocal launched
+            while launched < len(candidates):
+                index = launched
+                launched += 1
+                provider_name, model_name, provider = candidates[index]
+                candidate_payload = payload
+                # The caller holds the primary's slot
+                ticket = NO_LIMIT
+                if index:
+                    ticket = admission.try_acquire(provider_name, model_name)
+                    if ticket is None:
+                        # Hedging into an upstream already at its limit
+                        # would only queue behind its own traffic
+                        continue
+                    HEDGES_FIRED.labels(provider=provider_name, model=model_name, reason=reason).inc()
+                    candidate_payload = {**payload, "model": model_name}
+                task = asyncio.create_task(
+                    self._attempt(provider, provider_name, model_name, candidate_payload, stream, ticket)
+                )
+                pending[task] = index
+                return
+        
+        launch(None)
+        try:
+            while pending:
+                timeout = None
+                if launched < len(candidates):
+                    timeout = self.delay_for(primary_name, primary_model)
+                
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch("delay")
+                    continue
+                
+                winner = None
+                for task in sorted(done, key=pending.get):
+                    index = pending.pop(task)
+                    if task.exception() is not None:
+                        errors[index] = task.exception()
+                    elif winner is None:
+                        winner = index, task.result()
+                    else:
+                        discard_result(task)
+                
+                if winner is not None:
+                    index, result = winner
+                    provider_name, model_name, provider = candidates[index]
+                    if index:
+                        HEDGE_WINS.labels(provider=provider_name, model=model_name).inc()
+                    if stream:
+                        result = normalize_stream(result, provider.schema, primary.schema)
+                    else:
+                        result = normalize_response(result, provider.schema, primary.schema)
+                    return candidates[index], result
+                
+                if launched < len(candidates):
+                    launch("failure")
+            
+            raise errors[min(errors)]
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(discard_result)
+
+    async def _attempt(self, provider, provider_name, model_name, payload, stream, ticket):
+        start = time.perf_counter()
+        try:
+            result = await resilient_generate(provider, provider_name, model_name, payload, stream)
+        except asyncio.CancelledError:
+            ticket.release()
+            # A hedged-away attempt only tells us its TTFT is at least this
+            # long; keeping the sample stops the percentile drifting down
+            self.record_ttft(provider_name, model_name, time.perf_counter() - start)
+            raise
+        except BaseException:
+            ticket.release()
+            raise
+        self.record_ttft(provider_name, model_name, time.perf_counter() - start)
+        
+        if not stream:
+            ticket.release()
+        elif ticket is not NO_LIMIT:
+            result = HeldStream(result, ticket)
+        return result
+
+
+class HeldStream:
+    """An upstream stream that keeps its admission slot until it ends or
+    is closed"""
+
+    def __init__(self, stream, ticket):
+        self.stream = stream
+        self.ticket = ticket
+        # Also free the slot if the stream is dropped without being closed
+        weakref.finalize(self, ticket.release)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.stream.__anext__()
+        except BaseException:
+            self.ticket.release()
+            raise
+
+    async def aclose(self):
+        self.ticket.release()
+        await self.stream.aclose()
+
+
+def discard_result(task):
+    if task.cancelled() or task.exception() is not None:
+        return
+    result = task.result()
+    if hasattr(result, "aclose"):
+        asyncio.ensure_future(result.aclose())
+
+
+hedger = Hedger(
+    chains=settings.FALLBACK_CHAINS,
+    delay=settings.HEDGE_DELAY,
+    mode=settings.HEDGE_DELAY_MODE,
+    percentile=settings.HEDGE_DELAY_PERCENTILE,
+    min_delay=settings.HEDGE_MIN_DELAY
+)
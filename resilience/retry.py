@@ -0,0 +1,119 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from config import settings
+from metrics.middleware import RETRY_ATTEMPTS
+from registry.upstream_pool import retry_after
+from resilience.circuit_breaker import CircuitBreakerRegistry
+
+
+RETRYABLE_STATUS = {429, 502, 503, 529}
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_RESET_TIMEOUT
+)
+
+
+class RetryDeadlineExceeded(Exception):
+    
+    def __init__(self, provider, model, deadline):
+        super().__init__(f"{provider}/{model} did not respond within {deadline}s")
+        self.provider = provider
+        self.model = model
+        self.deadline = deadline
+
+
+def retry_reason(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return str(status) if status in RETRYABLE_STATUS else None
+    if isinstance(error, RETRYABLE_TRANSPORT_ERRORS):
+        return "connect"
+    return None
+
+
+def is_upstream_failure(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff_delay(attempt):
+    ceiling = min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+async def resilient_generate(provider, provider_name, model_name, payload, stream):
+    breaker = circuit_breakers.get(provider_name, model_name)
+    deadline = time.monotonic() + settings.RETRY_DEADLINE
+    attempt = 0
+    
+    while True:
+        breaker.check()
+        try:
+            # The deadline covers a stream up to its first chunk. A whole
+            # response body can legitimately take longer, so that is left
+            # to the upstream read timeout
+            async with asyncio.timeout(deadline - time.monotonic() if stream else None):
+                if stream:
+                    result = await open_stream(await provider.generate(payload, stream=True))
+                else:
+                    result = await provider.generate(payload, stream=False)
+        
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except TimeoutError:
+            # Our budget ran out; a slow first chunk is no sign the
+            # upstream is broken
+            breaker.release()
+            raise RetryDeadlineExceeded(provider_name, model_name, settings.RETRY_DEADLINE)
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            
+            reason = retry_reason(e)
+            attempt += 1
+            if reason is None or attempt >= settings.RETRY_MAX_ATTEMPTS:
+                raise
+            
+            delay = backoff_delay(attempt)
+            if isinstance(e, httpx.HTTPStatusError):
+                delay = max(delay, retry_after(e.response) or 0)
+            if time.monotonic() + delay > deadline:
+                raise
+            
+            RETRY_ATTEMPTS.labels(provider=provider_name, model=model_name, reason=reason).inc()
+            await asyncio.sleep(delay)
+            continue
+        
+        breaker.record_success()
+        return result
+
+
+async def open_stream(stream):
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await stream.aclose()
+        raise
+
+    async def replay_first():
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    
+    return replay_first()
@@ -1,17 +1,67 @@
+import asyncio
+import time
+import weakref
+import httpx
+import orjson
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List, Dict, Any
-import tiktoken
+from config import settings
+from cache.response_cache import response_cache
+from cache.single_flight import single_flight, FlightAbandoned
+from limits.admission import admission, AdmissionRejected
+from limits.context_window import context_preflight, ContextWindowExceeded
+from limits.rate_limiter import rate_limiter, estimate_request_tokens, RateLimitExceeded, CHARS_PER_TOKEN
+from providers.base import RawResponse
 from registry.provider_registry import provider_registry
-from metrics.middleware import record_token_usage
+from registry.routing_table import routing_table
+from resilience.circuit_breaker import CircuitOpenError
+from resilience.hedging import hedger
+from resilience.retry import resilient_generate, is_upstream_failure, retry_reason, RetryDeadlineExceeded
+from metrics.middleware import (
+    record_token_usage, track_request, latency_metrics, upstream_stats, BATCH_ITEMS, CLIENT_CANCELLATIONS
+)
+from streaming.response import ClosingStreamingResponse
+from tokenization.service import tokenizer
+from usage.ledger import usage_ledger
+from usage.tracker import StreamUsageTracker, usage_from_response
 
-try:
-    token_encoding = tiktoken.get_encoding("cl100k_base")
-except:
-    token_encoding = None
 
-llm_router = APIRouter(prefix="/v1")
+
+class ORJSONRequest(Request):
+    
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Parses JSON request bodies with orjson before pydantic validation"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            return await handler(ORJSONRequest(request.scope, request.receive))
+        
+        return route_handler
+
+
+llm_router = APIRouter(prefix="/v1", route_class=ORJSONRoute)
+
+DISCONNECT_WATCH_DELAY = 0.1
+
+# Usage of abandoned requests is settled after the response is gone
+background_tasks = set()
+
+
+class ClientDisconnected(HTTPException):
+    
+    def __init__(self):
+        super().__init__(status_code=499, detail="Client closed request")
 
 
 class Message(BaseModel):
@@ -36,82 +86,671 @@ class ChatResponse(BaseModel):
 
 @llm_router.post("/chat/completions")
 async def chat_completions(request: Request, chat_request: ChatRequest):
+    route = resolve_route(chat_request)
+    provider_name, model_name, provider = route.provider_name, route.model_name, route.provider
+    track_request(request.state, provider_name, model_name)
+    priority = admission.priority_for(getattr(request.state, "claims", None))
+    await preflight(chat_request, route)
+    reservation = reserve(request, chat_request)
+    cache_key, flight_key = request_keys(request, chat_request)
     
-    if "/" not in chat_request.model:
-        raise ValueError("Model format should be 'provider/model-name'")
+    if cache_key:
+        entry = response_cache.get(cache_key, chat_request.stream)
+        if entry is not None:
+            if reservation:
+                reservation.settle(0)
+            return replay_cached_response(provider, entry, chat_request.stream)
     
-    provider_name, model_name = chat_request.model.split("/", 1)
+    payload = build_payload(chat_request, model_name, chat_request.stream)
     
-    request.state.provider = provider_name
-    request.state.model = model_name
+    try:
+        if chat_request.stream:
+            return await until_disconnected(request, handle_streaming_request(
+                request, provider, payload, provider_name, model_name, cache_key, flight_key, reservation, priority
+            ))
+        elif flight_key:
+            leader = False
+
+            def lead():
+                nonlocal leader
+                leader = True
+                return handle_non_streaming_request(
+                    request, provider, payload, provider_name, model_name, cache_key, reservation, priority
+                )
+            
+            try:
+                return as_response(await until_disconnected(request, single_flight.call(flight_key, lead)))
+            finally:
+                # Followers share the leader's upstream call and use none
+                # of their own reservation
+                if not leader and reservation:
+                    reservation.settle(0)
+        else:
+            return as_response(await until_disconnected(request, handle_non_streaming_request(
+                request, provider, payload, provider_name, model_name, cache_key, reservation, priority
+            )))
+    except ClientDisconnected:
+        # The cancelled call settles the reservation itself: with partial
+        # usage once it went upstream, with nothing while still queued
+        raise
+    except Exception:
+        if reservation:
+            reservation.settle(0)
+        raise
+
+
+def resolve_route(chat_request):
+    """Looks the model up in the routing table, picking a candidate if it
+    names a model group, then rewrites the request to the canonical model
+    name and fills in the route's default parameters for anything the
+    client did not send"""
+    table = routing_table.table
+    group = table.groups.get(chat_request.model)
+    try:
+        if group is not None:
+            route = provider_registry.select(
+                group, estimate_request_tokens(chat_request.messages, 0), chat_request.max_tokens or 0
+            )
+        else:
+            route = table.resolve(chat_request.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    chat_request.model = route.name
+    for name, value in route.defaults.items():
+        if name not in chat_request.model_fields_set:
+            setattr(chat_request, name, value)
+    return route
+
+
+async def preflight(chat_request, route):
+    """Rejects or compacts prompts that cannot fit the model's context
+    window; runs before the rate limit reservation and cache key so both
+    see the messages that are actually sent"""
+    window = route.capabilities.get("max_tokens")
+    if not window:
+        return
     
-    provider_class = provider_registry.get(provider_name)
-    provider = provider_class()
+    try:
+        chat_request.messages = await context_preflight.check(
+            route.provider_name, route.model_name, window, chat_request.messages, chat_request.max_tokens
+        )
+    except ContextWindowExceeded as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def reserve(request, chat_request):
+    try:
+        return rate_limiter.acquire(
+            getattr(request.state, "user_id", None),
+            getattr(request.state, "claims", None),
+            chat_request.model,
+            estimate_request_tokens(chat_request.messages, chat_request.max_tokens)
+        )
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+
+
+def request_keys(request, chat_request):
+    request_key = None
+    if (response_cache.enabled or single_flight.enabled) and is_deterministic(request, chat_request):
+        request_key = response_cache.key_for(chat_request, getattr(request.state, "user_id", None))
     
-    payload = {
+    cache_key = request_key if response_cache.enabled else None
+    flight_key = request_key if single_flight.enabled else None
+    return cache_key, flight_key
+
+
+def build_payload(chat_request, model_name, stream):
+    return {
         "model": model_name,
-        "messages": [msg.dict() for msg in chat_request.messages],
-        "stream": chat_request.stream,
+        "messages": [{"role": msg.role, "content": msg.content} for msg in chat_request.messages],
+        "stream": stream,
         "temperature": chat_request.temperature,
         "max_tokens": chat_request.max_tokens
     }
+
+
+def as_response(result):
+    # Bytes from the upstream go back as they came; only responses that
+    # were translated or built here are serialised
+    if isinstance(result, RawResponse):
+        return Response(content=result.body, media_type="application/json")
+    return result
+
+
+def is_deterministic(request, chat_request):
+    opt_in = request.headers.get("X-Gateway-Cache", "").lower()
+    if opt_in == "off":
+        return False
+    return chat_request.temperature == 0 or opt_in == "on"
+
+
+def replay_cached_response(provider, entry, stream):
+    headers = {"X-Cache": "HIT"}
     
-    if chat_request.stream:
-        return await handle_streaming_request(provider, payload, provider_name, model_name)
+    if not stream:
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+    
+    if entry.chunks is not None:
+        chunks = replay_chunks(entry.chunks)
     else:
-        return await handle_non_streaming_request(provider, payload, provider_name, model_name)
+        chunks = provider.stream_from_response(orjson.loads(entry.body))
+    return ClosingStreamingResponse(chunks, media_type="text/event-stream", headers=headers)
+
+
+async def replay_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
 
+async def admit(provider_name, model_name, priority):
+    try:
+        return await admission.acquire(provider_name, model_name, priority)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
+
+
+async def until_disconnected(request, work):
+    """Awaits work unless the client disconnects first, in which case the
+    work is cancelled, taking the upstream request down with it"""
+    task = asyncio.current_task()
+    watcher = None
+    disconnected = False
+
+    async def watch():
+        nonlocal disconnected
+        await wait_for_disconnect(request)
+        disconnected = True
+        task.cancel()
 
-async def handle_non_streaming_request(provider, payload, provider_name, model_name):
-    response = await provider.generate(payload, stream=False)
+    def start_watching():
+        nonlocal watcher
+        watcher = asyncio.create_task(watch())
     
-    if token_encoding:
-        input_text = " ".join([f"{m.get('role', '')}: {m.get('content', '')}" 
-                               for m in payload.get("messages", [])])
-        input_tokens = len(token_encoding.encode(input_text))
-        
+    # Most calls finish before a watcher would be worth its cost
+    timer = asyncio.get_running_loop().call_later(DISCONNECT_WATCH_DELAY, start_watching)
+    try:
+        return await work
+    except asyncio.CancelledError:
+        if not disconnected:
+            raise
+        # By now the upstream call has unwound (connection back to the
+        # pool, admission slot released)
+        task.uncancel()
+        raise ClientDisconnected()
+    finally:
+        timer.cancel()
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def wait_for_disconnect(request):
+    # The body has been read by now, so the only message left is the
+    # disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def record_usage(state, provider_name, model_name, input_tokens, output_tokens):
+    record_token_usage(provider_name, model_name, input_tokens, output_tokens)
+    # Picked up by the usage ledger when the request finishes
+    state.usage = (provider_name, model_name, input_tokens, output_tokens)
+
+
+def abandon(state, provider_name, model_name, kind, payload, reservation, input_tokens=None, output_tokens=0):
+    """Accounts for an upstream call cancelled because the client left;
+    the upstream has usually already billed the prompt and any output"""
+    CLIENT_CANCELLATIONS.labels(provider=provider_name, model=model_name, kind=kind).inc()
+    received_at = getattr(state, "received_at", None)
+    duration = time.perf_counter() - received_at if received_at else 0.0
+    # The ledger record is written once the prompt has been counted
+    state.usage_recorded = True
+    task = asyncio.get_running_loop().create_task(record_partial_usage(
+        getattr(state, "user_id", None), provider_name, model_name, payload["messages"],
+        input_tokens, output_tokens, getattr(state, "ttft", None), duration, reservation
+    ))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+def abandon_queued(provider_name, model_name, kind, reservation):
+    """Accounts for a client that left while still waiting for admission;
+    nothing went upstream, so none of the reservation is used"""
+    CLIENT_CANCELLATIONS.labels(provider=provider_name, model=model_name, kind=kind).inc()
+    if reservation:
+        reservation.settle(0)
+
+
+async def count_input_tokens(messages):
+    if tokenizer.available:
+        return await tokenizer.count_messages(messages)
+    return sum(len(message["content"]) for message in messages) // CHARS_PER_TOKEN
+
+
+async def record_partial_usage(user_id, provider_name, model_name, messages, input_tokens, output_tokens,
+                               ttft, duration, reservation):
+    if input_tokens is None:
+        input_tokens = await count_input_tokens(messages)
+    
+    record_token_usage(provider_name, model_name, input_tokens, output_tokens)
+    usage_ledger.record(user_id, provider_name, model_name, input_tokens, output_tokens, ttft, duration, 499)
+    if reservation:
+        reservation.settle(input_tokens + output_tokens)
+
+
+async def call_upstream(provider, payload, provider_name, model_name, stream):
+    candidates = [(provider_name, model_name, provider)]
+    for fallback_name, fallback_model in hedger.fallbacks_for(provider_name, model_name):
+        if fallback_name in provider_registry.instances:
+            candidates.append((fallback_name, fallback_model, provider_registry.get(fallback_name)))
+    
+    try:
+        if len(candidates) == 1:
+            result = await resilient_generate(provider, provider_name, model_name, payload, stream)
+            chosen = candidates[0]
+        else:
+            chosen, result = await hedger.generate(candidates, payload, stream)
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
+    except RetryDeadlineExceeded as e:
+        upstream_stats(provider_name, model_name).record_outcome(True)
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        if upstream_failed(e):
+            upstream_stats(provider_name, model_name).record_outcome(True)
+        raise
+    
+    # Streams count as a success once they finish
+    if not stream:
+        upstream_stats(chosen[0], chosen[1]).record_outcome(False)
+    return chosen, result
+
+
+def upstream_failed(error):
+    return is_upstream_failure(error) or retry_reason(error) is not None
+
+
+async def handle_non_streaming_request(request, provider, payload, provider_name, model_name, cache_key=None,
+                                       reservation=None, priority=0):
+    received_at = getattr(request.state, "received_at", None) or time.perf_counter()
+    overhead = time.perf_counter() - received_at
+    try:
+        ticket = await admit(provider_name, model_name, priority)
+    except asyncio.CancelledError:
+        abandon_queued(provider_name, model_name, "response", reservation)
+        raise
+    try:
+        upstream_started = time.perf_counter()
+        (provider_name, model_name, provider), response = await call_upstream(
+            provider, payload, provider_name, model_name, stream=False
+        )
+        upstream_done = time.perf_counter()
+    except asyncio.CancelledError:
+        abandon(request.state, provider_name, model_name, "response", payload, reservation)
+        raise
+    finally:
+        ticket.release()
+    
+    if cache_key:
+        body = response.body if isinstance(response, RawResponse) else orjson.dumps(response)
+        response_cache.put_response(cache_key, body)
+    
+    usage = usage_from_response(response)
+    if usage:
+        record_usage(request.state, provider_name, model_name, *usage)
+        if reservation:
+            reservation.settle(sum(usage))
+    elif tokenizer.available:
         output_text = ""
-        if isinstance(response, dict):
-            if "choices" in response and response["choices"]:
-                output_text = response["choices"][0].get("message", {}).get("content", "")
-            elif "content" in response:
-                content = response["content"]
+        data = response.json() if isinstance(response, RawResponse) else response
+        if isinstance(data, dict):
+            if "choices" in data and data["choices"]:
+                output_text = data["choices"][0].get("message", {}).get("content", "")
+            elif "content" in data:
+                content = data["content"]
                 output_text = content[0].get("text", "") if isinstance(content, list) else str(content)
         
-        output_tokens = len(token_encoding.encode(output_text)) if output_text else 0
-        record_token_usage(provider_name, model_name, input_tokens, output_tokens)
+        input_tokens, output_tokens = await asyncio.gather(
+            tokenizer.count_messages(payload["messages"]),
+            tokenizer.count(output_text)
+        )
+        record_usage(request.state, provider_name, model_name, input_tokens, output_tokens)
+        if reservation:
+            reservation.settle(input_tokens + output_tokens)
     
+    metrics = latency_metrics(provider_name, model_name)
+    if usage and usage[1]:
+        # The time to first token is what generating the output at the
+        # observed rate does not explain; with no rate yet, the whole
+        # response's rate stands in for it
+        elapsed = upstream_done - upstream_started
+        if metrics.stats.throughput:
+            metrics.stats.record_ttft(max(0.0, elapsed - usage[1] / metrics.stats.throughput))
+        else:
+            metrics.stats.record_throughput(usage[1] / elapsed)
+    metrics.overhead.observe(overhead + time.perf_counter() - upstream_done)
     return response
 
 
-async def handle_streaming_request(provider, payload, provider_name, model_name):
-    stream = await provider.generate(payload, stream=True)
+async def handle_streaming_request(request, provider, payload, provider_name, model_name, cache_key=None,
+                                   flight_key=None, reservation=None, priority=0):
+    flight = None
+    while flight_key:
+        flight, leader = single_flight.open_stream(flight_key)
+        if leader:
+            break
+        try:
+            chunks = await single_flight.follow_stream(flight)
+        except FlightAbandoned:
+            # The leader went away before its first byte; start over, most
+            # likely as the new leader
+            flight = None
+            continue
+        finally:
+            # Only the leader's reservation is used, unless this caller
+            # goes on to lead after all
+            if flight is not None and reservation:
+                reservation.settle(0)
+        return ClosingStreamingResponse(chunks, media_type="text/event-stream")
+    
+    received_at = getattr(request.state, "received_at", None) or time.perf_counter()
+    setup_overhead = time.perf_counter() - received_at
+    try:
+        ticket = await admit(provider_name, model_name, priority)
+    except asyncio.CancelledError:
+        if flight is not None:
+            flight.abandon()
+        abandon_queued(provider_name, model_name, "stream", reservation)
+        raise
+    except BaseException as e:
+        if flight is not None:
+            flight.abandon(e)
+        raise
+    try:
+        (provider_name, model_name, provider), stream = await call_upstream(
+            provider, payload, provider_name, model_name, stream=True
+        )
+    except asyncio.CancelledError:
+        ticket.release()
+        if flight is not None:
+            flight.abandon()
+        abandon(request.state, provider_name, model_name, "stream", payload, reservation)
+        raise
+    except BaseException as e:
+        ticket.release()
+        if flight is not None:
+            flight.abandon(e)
+        raise
+    metrics = latency_metrics(provider_name, model_name)
+    started = False
     
     async def stream_generator():
-        output_chunks = []
+        nonlocal started
+        started = True
+        tracker = StreamUsageTracker(tokenizer, count_text=not provider.reports_stream_usage)
+        cached_chunks = [] if cache_key else None
+        cached_size = 0
+        first_at = None
+        last_at = None
+        # Admission queueing and upstream waits are excluded; they have
+        # their own histograms
+        overhead = setup_overhead
         
         try:
             async for chunk in stream:
-                chunk_text = extract_text_from_chunk(chunk)
-                if chunk_text:
-                    output_chunks.append(chunk_text)
+                now = time.perf_counter()
+                if first_at is None:
+                    first_at = now
+                    metrics.ttft.observe(now - received_at)
+                    metrics.stats.record_ttft(now - received_at)
+                    request.state.ttft = now - received_at
+                else:
+                    metrics.inter_chunk.observe(now - last_at)
+                last_at = now
+                
+                tracker.feed(chunk)
+                if cached_chunks is not None:
+                    cached_size += len(chunk)
+                    if cached_size <= response_cache.max_entry_bytes:
+                        cached_chunks.append(chunk)
+                    else:
+                        cached_chunks = None
+                overhead += time.perf_counter() - now
                 yield chunk
             
-            if token_encoding:
-                input_text = " ".join([f"{m.get('role', '')}: {m.get('content', '')}" 
-                                      for m in payload.get("messages", [])])
-                input_tokens = len(token_encoding.encode(input_text))
-                
-                output_text = "".join(output_chunks)
-                output_tokens = len(token_encoding.encode(output_text)) if output_text else 0
-                
-                record_token_usage(provider_name, model_name, input_tokens, output_tokens)
+            metrics.duration.observe(time.perf_counter() - received_at)
+            metrics.overhead.observe(overhead)
+            metrics.stats.record_outcome(False)
+            
+            if cached_chunks is not None:
+                response_cache.put_stream(cache_key, cached_chunks)
+            
+            input_tokens, output_tokens = tracker.finish()
+            if input_tokens is None:
+                input_tokens = await count_input_tokens(payload["messages"])
+            
+            record_usage(request.state, provider_name, model_name, input_tokens, output_tokens)
+            if reservation:
+                reservation.settle(input_tokens + output_tokens)
+            
+            if output_tokens and first_at is not None and last_at > first_at:
+                metrics.tokens_per_second.observe(output_tokens / (last_at - first_at))
+                metrics.stats.record_throughput(output_tokens / (last_at - first_at))
                 
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away (or every coalesced subscriber did)
+            abandon(request.state, provider_name, model_name, "stream", payload, reservation, *tracker.finish())
+            raise
         except Exception as e:
+            if upstream_failed(e):
+                metrics.stats.record_outcome(True)
             error_msg = f'data: {{"error": "{str(e)}"}}\n\n'
             yield error_msg.encode()
+        finally:
+            ticket.release()
+            # Closes the upstream response now rather than when it is
+            # garbage collected
+            await stream.aclose()
+
+    async def close_unstarted():
+        # Gone before the first chunk was pulled, so the generator body and
+        # its cleanup never ran
+        if not started:
+            ticket.release()
+            abandon(request.state, provider_name, model_name, "stream", payload, reservation)
+            await stream.aclose()
+    
+    chunks = stream_generator()
+    # The slot is held for the whole stream; also free it if the response
+    # is dropped before the generator ever starts
+    weakref.finalize(chunks, ticket.release)
+    if flight is not None:
+        # The flight pumps the generator on its own; it stops once the
+        # last subscriber leaves
+        flight.start(chunks, on_close=close_unstarted)
+        return ClosingStreamingResponse(flight.subscribe(), media_type="text/event-stream")
+    
+    return ClosingStreamingResponse(chunks, on_close=close_unstarted, media_type="text/event-stream")
+
+
+@llm_router.post("/batch")
+async def batch(request: Request):
+    track_request(request.state, "batch", "batch")
+    lines = await read_batch_lines(request)
     
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    priority = admission.priority_for(getattr(request.state, "claims", None))
+    user_id = getattr(request.state, "user_id", None)
+    # Each item gets its own ledger record instead of one for the batch
+    request.state.usage_recorded = True
+    semaphores = {}
+
+    async def run_item(index, line):
+        provider_name = model_name = "unknown"
+        usage = None
+        started_at = time.perf_counter()
+        try:
+            chat_request = ChatRequest.model_validate_json(line)
+            route = resolve_route(chat_request)
+            provider_name, model_name = route.provider_name, route.model_name
+            semaphore = semaphores.get(provider_name)
+            if semaphore is None:
+                semaphore = semaphores[provider_name] = asyncio.Semaphore(settings.BATCH_PROVIDER_CONCURRENCY)
+            
+            # Items are not tracked by the metrics middleware, so count them
+            # towards the candidate's in-flight requests here
+            stats = upstream_stats(provider_name, model_name)
+            stats.in_flight += 1
+            try:
+                async with semaphore:
+                    response = await complete_batch_item(request, chat_request, route, priority)
+            finally:
+                stats.in_flight -= 1
+            
+            usage = usage_from_response(response)
+            result = {
+                "index": index,
+                "status": 200,
+                "response": response,
+                "usage": {"input_tokens": usage[0], "output_tokens": usage[1]} if usage else None
+            }
+        except Exception as e:
+            status, error = batch_error(e)
+            result = {"index": index, "status": status, "error": error}
+        
+        BATCH_ITEMS.labels(
+            provider=provider_name,
+            model=model_name,
+            status="success" if result["status"] == 200 else "error"
+        ).inc()
+        usage_ledger.record(user_id, provider_name, model_name, *(usage or (0, 0)), None,
+                            time.perf_counter() - started_at, result["status"])
+        return result
+
+    async def results():
+        # Work starts only once the client is reading; if it goes away the
+        # response is cancelled and so is every item still running
+        tasks = [asyncio.create_task(run_item(index, line)) for index, line in enumerate(lines)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield batch_line(await next_result)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return ClosingStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def complete_batch_item(request, chat_request, route, priority):
+    provider_name, model_name, provider = route.provider_name, route.model_name, route.provider
+    await preflight(chat_request, route)
+    reservation = reserve(request, chat_request)
+    cache_key, flight_key = request_keys(request, chat_request)
+    
+    if cache_key:
+        entry = response_cache.get(cache_key, False)
+        if entry is not None:
+            if reservation:
+                reservation.settle(0)
+            return RawResponse(entry.body)
+    
+    # Batch results are whole responses, so items asking to stream are
+    # answered non-streaming
+    payload = build_payload(chat_request, model_name, False)
+    
+    leader = not flight_key
+
+    def lead():
+        nonlocal leader
+        leader = True
+        return handle_non_streaming_request(
+            request, provider, payload, provider_name, model_name, cache_key, reservation, priority
+        )
+    
+    try:
+        if flight_key:
+            return await single_flight.call(flight_key, lead)
+        return await lead()
+    except Exception:
+        if reservation:
+            reservation.settle(0)
+        raise
+    finally:
+        # Followers share the leader's upstream call
+        if not leader and reservation:
+            reservation.settle(0)
+
+
+async def read_batch_lines(request):
+    """The non-empty lines of the NDJSON body, read as it arrives so a
+    batch over the size or request limit is turned away without buffering
+    all of it"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > settings.BATCH_MAX_BYTES:
+        raise batch_too_large(f"Batch body is {length} bytes, the limit is {settings.BATCH_MAX_BYTES}")
+    
+    lines = []
+    buffer = bytearray()
+    async for chunk in request.stream():
+        if len(buffer) + len(chunk) > settings.BATCH_MAX_BYTES:
+            raise batch_too_large(f"Batch body is over the {settings.BATCH_MAX_BYTES} byte limit")
+        # Searching only the new chunk keeps long lines from being rescanned
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            buffer += chunk
+            continue
+        end += len(buffer)
+        buffer += chunk
+        lines.extend(line for line in bytes(buffer[:end]).split(b"\n") if line.strip())
+        del buffer[:end + 1]
+        if len(lines) > settings.BATCH_MAX_REQUESTS:
+            raise batch_too_large(f"Batch has more than {settings.BATCH_MAX_REQUESTS} requests")
+    
+    if buffer.strip():
+        lines.append(bytes(buffer))
+    if len(lines) > settings.BATCH_MAX_REQUESTS:
+        raise batch_too_large(f"Batch has more than {settings.BATCH_MAX_REQUESTS} requests")
+    return lines
+
+
+def batch_too_large(detail):
+    return HTTPException(status_code=413, detail=detail)
+
+
+def batch_line(result):
+    response = result.pop("response", None)
+    line = orjson.dumps(result)
+    if response is None:
+        return line + b"\n"
+    
+    if isinstance(response, RawResponse):
+        # Raw newlines in JSON can only be whitespace between tokens, so
+        # dropping them keeps the upstream body valid and on one line
+        body = response.body.strip().replace(b"\r", b"").replace(b"\n", b"")
+    else:
+        body = orjson.dumps(response)
+    return line[:-1] + b',"response":' + body + b"}\n"
+
+
+def batch_error(error):
+    if isinstance(error, HTTPException):
+        return error.status_code, error.detail
+    if isinstance(error, (ValueError, ValidationError)):
+        return 400, str(error)
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code, str(error)
+    if isinstance(error, httpx.TransportError):
+        return 502, str(error) or type(error).__name__
+    return 500, str(error) or type(error).__name__
 
 
 @llm_router.get("/health")
@@ -121,33 +760,4 @@ async def health_check():
 
 @llm_router.get("/models")
 async def list_models():
-    models = {}
-    for provider_name in provider_registry.providers.keys():
-        capabilities = provider_registry.model_capabilities.get(provider_name, {})
-        models[provider_name] = capabilities
-    
-    return {"models": models}
-
-
-def extract_text_from_chunk(chunk):
-    try:
-        import json
-        
-        if isinstance(chunk, bytes):
-            chunk = chunk.decode('utf-8')
-        
-        if isinstance(chunk, str) and chunk.startswith("data: "):
-            data_str = chunk[6:].strip()
-            if data_str and data_str != "[DONE]":
-                data = json.loads(data_str)
-                
-                if "choices" in data and data["choices"]:
-                    delta = data["choices"][0].get("delta", {})
-                    return delta.get("content", "")
-                
-                if "delta" in data:
-                    return data["delta"].get("text", "")
-        
-        return ""
-    except:
-        return ""
+    return Response(content=routing_table.table.models_body, media_type="application/json")
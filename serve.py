@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Production launcher for AI Proxy Gateway
+
+Runs the app under uvicorn with one worker per CPU (or --workers). Metrics
+from all workers are aggregated through prometheus_client's multiprocess
+mode and served by the supervisor on PROMETHEUS_PORT, so scrapes never run
+on a worker's request loop. On SIGTERM/SIGINT workers stop accepting new
+connections and let in-flight requests and streams finish for up to
+SHUTDOWN_GRACE_PERIOD seconds before the providers are closed.
+
+For local development keep using `python app.py` (single worker, reload).
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+
+import uvicorn
+
+from config import settings
+
+
+def prepare_multiprocess_dir():
+    """Must run before prometheus_client is imported anywhere, workers
+    inherit the directory through the environment"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.path.join(tempfile.gettempdir(), "ai-proxy-metrics")
+    os.makedirs(path, exist_ok=True)
+    # Files left by a previous run would be summed into the new one
+    clear_multiprocess_dir(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def clear_multiprocess_dir(path):
+    for name in glob.glob(os.path.join(path, "*.db")):
+        os.remove(name)
+
+
+def start_metrics_server(port):
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+    
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS,
+                        help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+    
+    workers = args.workers or os.cpu_count() or 1
+    metrics_dir = prepare_multiprocess_dir()
+    start_metrics_server(settings.PROMETHEUS_PORT)
+    
+    try:
+        uvicorn.run(
+            "app:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            timeout_graceful_shutdown=settings.SHUTDOWN_GRACE_PERIOD,
+            access_log=False
+        )
+    finally:
+        clear_multiprocess_dir(metrics_dir)
+
+
+if __name__ == "__main__":
+    main()
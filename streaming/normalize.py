@@ -0,0 +1,203 @@
+import time
+
+import orjson
+
+from providers.base import RawResponse
+from streaming.sse import iter_data, sse_chunk
+
+
+OPENAI_FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls"
+}
+
+ANTHROPIC_STOP_REASONS = {
+    "stop": "end_turn",
+    "length": "max_tokens",
+    "tool_calls": "tool_use",
+    "content_filter": "end_turn"
+}
+
+
+def normalize_response(response, source, target):
+    if source == target:
+        return response
+    if isinstance(response, RawResponse):
+        response = response.json()
+    if not isinstance(response, dict):
+        return response
+    if target == "openai":
+        return openai_response_from_anthropic(response)
+    return anthropic_response_from_openai(response)
+
+
+def normalize_stream(stream, source, target):
+    if source == target:
+        return stream
+    if target == "openai":
+        return openai_stream_from_anthropic(stream)
+    return anthropic_stream_from_openai(stream)
+
+
+def openai_response_from_anthropic(response):
+    text = "".join(
+        block.get("text", "") for block in response.get("content") or []
+        if block.get("type") == "text"
+    )
+    usage = response.get("usage") or {}
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    
+    return {
+        "id": response.get("id"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": response.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": OPENAI_FINISH_REASONS.get(response.get("stop_reason"), "stop")
+        }],
+        "usage": {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+    }
+
+
+def anthropic_response_from_openai(response):
+    choice = (response.get("choices") or [{}])[0]
+    text = (choice.get("message") or {}).get("content") or ""
+    usage = response.get("usage") or {}
+    
+    return {
+        "id": response.get("id"),
+        "type": "message",
+        "role": "assistant",
+        "model": response.get("model"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": ANTHROPIC_STOP_REASONS.get(choice.get("finish_reason"), "end_turn"),
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0)
+        }
+    }
+
+
+async def openai_stream_from_anthropic(stream):
+    message_id = None
+    model = None
+    created = int(time.time())
+    input_tokens = 0
+    output_tokens = 0
+
+    def chunk(delta, finish_reason=None):
+        return sse_chunk({
+            "id": message_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        })
+    
+    try:
+        async for frames in stream:
+            out = []
+            for data in iter_data(frames):
+                event = orjson.loads(data)
+                kind = event.get("type")
+                
+                if kind == "message_start":
+                    message = event.get("message") or {}
+                    message_id = message.get("id")
+                    model = message.get("model")
+                    input_tokens = (message.get("usage") or {}).get("input_tokens", 0)
+                    out.append(chunk({"role": "assistant", "content": ""}))
+                elif kind == "content_block_delta":
+                    delta = event.get("delta") or {}
+                    if delta.get("type") == "text_delta":
+                        out.append(chunk({"content": delta.get("text", "")}))
+                elif kind == "message_delta":
+                    stop_reason = (event.get("delta") or {}).get("stop_reason")
+                    output_tokens = (event.get("usage") or {}).get("output_tokens", output_tokens)
+                    out.append(chunk({}, OPENAI_FINISH_REASONS.get(stop_reason, "stop")))
+                elif kind == "message_stop":
+                    out.append(sse_chunk({
+                        "id": message_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [],
+                        "usage": {
+                            "prompt_tokens": input_tokens,
+                            "completion_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens
+                        }
+                    }))
+                    out.append(b"data: [DONE]\n\n")
+                elif kind == "error":
+                    out.append(sse_chunk({"error": event.get("error")}))
+            
+            if out:
+                yield b"".join(out)
+    finally:
+        await stream.aclose()
+
+
+async def anthropic_stream_from_openai(stream):
+    started = False
+    stop_reason = "end_turn"
+    usage = {}
+    
+    try:
+        async for frames in stream:
+            out = []
+            for data in iter_data(frames):
+                event = orjson.loads(data)
+                if "error" in event:
+                    out.append(sse_chunk({"type": "error", "error": event["error"]}, "error"))
+                    continue
+                
+                if not started:
+                    started = True
+                    out.append(sse_chunk({"type": "message_start", "message": {
+                        "id": event.get("id"),
+                        "type": "message",
+                        "role": "assistant",
+                        "model": event.get("model"),
+                        "content": [],
+                        "stop_reason": None,
+                        "usage": {"input_tokens": 0, "output_tokens": 0}
+                    }}, "message_start"))
+                    out.append(sse_chunk({"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}}, "content_block_start"))
+                
+                for choice in event.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        out.append(sse_chunk({"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": content}}, "content_block_delta"))
+                    if choice.get("finish_reason"):
+                        stop_reason = ANTHROPIC_STOP_REASONS.get(choice["finish_reason"], "end_turn")
+                
+                if event.get("usage"):
+                    usage = event["usage"]
+            
+            if out:
+                yield b"".join(out)
+        
+        if started:
+            yield b"".join([
+                sse_chunk({"type": "content_block_stop", "index": 0}, "content_block_stop"),
+                sse_chunk({"type": "message_delta",
+                           "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                           "usage": {"input_tokens": usage.get("prompt_tokens", 0),
+                                     "output_tokens": usage.get("completion_tokens", 0)}}, "message_delta"),
+                sse_chunk({"type": "message_stop"}, "message_stop")
+            ])
+    finally:
+        await stream.aclose()
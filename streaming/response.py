@@ -0,0 +1,23 @@
+from fastapi.responses import StreamingResponse
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """Starlette stops a stream on client disconnect by cancelling its send
+    loop, which leaves a generator parked at a yield (and the upstream
+    connection behind it) open until it is garbage collected. This closes
+    the body iterator as soon as the response ends, then runs on_close for
+    cleanup that must happen even if the iterator never started"""
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if self.on_close is not None:
+                await self.on_close()
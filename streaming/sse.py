@@ -0,0 +1,102 @@
+import re
+
+import orjson
+
+
+USAGE_PATTERN = re.compile(rb'"usage"\s*:\s*\{')
+TEXT_PATTERN = re.compile(rb'"(?:content|text)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def sse_chunk(data, event=None):
+    frame = b"data: " + orjson.dumps(data) + b"\n\n"
+    if event:
+        frame = b"event: " + event.encode() + b"\n" + frame
+    return frame
+
+
+def complete_length(buffer):
+    end = buffer.rfind(b"\n\n")
+    end = end + 2 if end >= 0 else 0
+    crlf_end = buffer.rfind(b"\r\n\r\n")
+    crlf_end = crlf_end + 4 if crlf_end >= 0 else 0
+    return max(end, crlf_end)
+
+
+class SSEFramer:
+    
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data):
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = b""
+        
+        end = complete_length(data)
+        if end == len(data):
+            return data
+        
+        self._buffer = data[end:]
+        return data[:end]
+
+    def flush(self):
+        remainder, self._buffer = self._buffer, b""
+        return remainder
+
+
+async def iter_sse(response):
+    framer = SSEFramer()
+    async for data in response.aiter_bytes():
+        frames = framer.feed(data)
+        if frames:
+            yield frames
+    
+    remainder = framer.flush()
+    if remainder:
+        yield remainder
+
+
+def iter_data(frames):
+    for line in frames.splitlines():
+        if line.startswith(b"data:"):
+            data = line[5:].strip()
+            if data and data != b"[DONE]":
+                yield data
+
+
+def iter_usage(frames):
+    if not USAGE_PATTERN.search(frames):
+        return
+    
+    for data in iter_data(frames):
+        if not USAGE_PATTERN.search(data):
+            continue
+        try:
+            event = orjson.loads(data)
+        except ValueError:
+            continue
+        
+        usage = event.get("usage")
+        if usage is None and event.get("type") == "message_start":
+            # Only the prompt is final here; output_tokens is a placeholder
+            # until message_delta reports the real count
+            usage = (event.get("message") or {}).get("usage") or {}
+            usage = {"input_tokens": usage["input_tokens"]} if "input_tokens" in usage else None
+        if usage:
+            yield usage
+
+
+def iter_text(frames):
+    for match in TEXT_PATTERN.finditer(frames):
+        text = match.group(1)
+        if not text:
+            continue
+        if b"\\" in text:
+            yield orjson.loads(b'"' + text + b'"')
+        else:
+            yield text.decode("utf-8", "replace")
+
+
+def text_length(frames):
+    """Bytes of generated text in frames, without decoding it"""
+    return sum(len(match.group(1)) for match in TEXT_PATTERN.finditer(frames))
@@ -0,0 +1,53 @@
+import hashlib
+from collections import OrderedDict
+
+from metrics.middleware import (
+    MESSAGE_TOKEN_CACHE_HITS,
+    MESSAGE_TOKEN_CACHE_MISSES,
+    MESSAGE_TOKEN_CACHE_EVICTIONS,
+    MESSAGE_TOKEN_CACHE_BYTES
+)
+
+# Approximate resident size of one entry: 16-byte digest key, small int
+# value and the OrderedDict node holding them.
+ENTRY_SIZE_BYTES = 160
+
+
+def message_key(role, content):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(role.encode())
+    digest.update(b"\0")
+    digest.update(content.encode())
+    return digest.digest()
+
+
+class MessageTokenCache:
+    
+    def __init__(self, max_bytes):
+        self.max_entries = max_bytes // ENTRY_SIZE_BYTES
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        count = self._entries.get(key)
+        if count is None:
+            MESSAGE_TOKEN_CACHE_MISSES.inc()
+            return None
+        self._entries.move_to_end(key)
+        MESSAGE_TOKEN_CACHE_HITS.inc()
+        return count
+
+    def put(self, key, count):
+        if self.max_entries <= 0:
+            return
+        
+        self._entries[key] = count
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            MESSAGE_TOKEN_CACHE_EVICTIONS.inc()
+        
+        MESSAGE_TOKEN_CACHE_BYTES.set(len(self._entries) * ENTRY_SIZE_BYTES)
+
+    def __len__(self):
+        return len(self._entries)
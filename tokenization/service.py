@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import tiktoken
+
+from config import settings
+from metrics.middleware import TOKENIZER_QUEUE_DEPTH, TOKENIZER_ENCODE_SECONDS
+from tokenization.message_cache import MessageTokenCache, message_key
+
+logger = logging.getLogger(__name__)
+
+
+class TokenizationService:
+    
+    def __init__(self, encoding_name, max_workers, inline_threshold, message_cache_bytes=0):
+        self.encoding_name = encoding_name
+        self.max_workers = max_workers
+        self.inline_threshold = inline_threshold
+        self.message_cache = MessageTokenCache(message_cache_bytes)
+        self.encoding = None
+        self._executor = None
+        self._pending = []
+        self._flush_scheduled = False
+        self._inline_encode_seconds = TOKENIZER_ENCODE_SECONDS.labels(mode="inline")
+        self._pool_encode_seconds = TOKENIZER_ENCODE_SECONDS.labels(mode="pool")
+
+    @property
+    def available(self):
+        return self.encoding is not None
+
+    async def startup(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="tokenizer"
+            )
+        
+        if self.encoding is None:
+            loop = asyncio.get_running_loop()
+            try:
+                self.encoding = await loop.run_in_executor(
+                    self._executor, tiktoken.get_encoding, self.encoding_name
+                )
+            except Exception as e:
+                logger.warning("Failed to load tokenizer '%s': %s", self.encoding_name, e)
+
+    async def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def count_inline(self, text):
+        if not text:
+            return 0
+        start = time.perf_counter()
+        tokens = len(self.encoding.encode_ordinary(text))
+        self._inline_encode_seconds.observe(time.perf_counter() - start)
+        return tokens
+
+    async def count(self, text):
+        if len(text) < self.inline_threshold or self._executor is None:
+            return self.count_inline(text)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        TOKENIZER_QUEUE_DEPTH.inc()
+        
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        
+        return await future
+
+    async def count_many(self, texts):
+        return await asyncio.gather(*[self.count(text) for text in texts])
+
+    async def count_messages(self, messages):
+        return sum(await self.message_counts(messages))
+
+    async def message_counts(self, messages):
+        counts = []
+        missing = []
+        
+        for message in messages:
+            role = message.get("role") or ""
+            content = message.get("content") or ""
+            key = message_key(role, content)
+            
+            count = self.message_cache.get(key)
+            if count is None:
+                missing.append((len(counts), key, f"{role}: {content}"))
+            counts.append(count)
+        
+        if missing:
+            encoded = await self.count_many([text for _, _, text in missing])
+            for (index, key, _), count in zip(missing, encoded):
+                self.message_cache.put(key, count)
+                counts[index] = count
+        
+        return counts
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        
+        loop = asyncio.get_running_loop()
+        workers = min(self.max_workers, len(pending))
+        for i in range(workers):
+            batch = pending[i::workers]
+            job = loop.run_in_executor(
+                self._executor, self._encode_batch, [text for text, _ in batch]
+            )
+            job.add_done_callback(partial(self._resolve, batch))
+
+    def _encode_batch(self, texts):
+        start = time.perf_counter()
+        counts = [len(self.encoding.encode_ordinary(text)) for text in texts]
+        self._pool_encode_seconds.observe(time.perf_counter() - start)
+        return counts
+
+    def _resolve(self, batch, job):
+        TOKENIZER_QUEUE_DEPTH.dec(len(batch))
+        
+        if job.cancelled():
+            for _, future in batch:
+                future.cancel()
+            return
+        
+        error = job.exception()
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(job.result()[i])
+
+
+tokenizer = TokenizationService(
+    "cl100k_base",
+    max_workers=settings.TOKENIZER_WORKERS,
+    inline_threshold=settings.TOKENIZER_INLINE_THRESHOLD,
+    message_cache_bytes=settings.MESSAGE_TOKEN_CACHE_BYTES
+)
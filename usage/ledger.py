@@ -0,0 +1,173 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import time
+from collections import deque
+
+import orjson
+
+from config import settings
+from metrics.middleware import USAGE_LEDGER_RECORDS, USAGE_LEDGER_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class UsageLedger:
+    """Append-only per-request usage records. record() only appends a tuple
+    to a bounded deque; a background task drains it in batches and does the
+    serialisation, file I/O and rotation in a thread"""
+
+    def __init__(self, enabled, path, max_bytes, rotate_interval, compress, queue_size, batch_size,
+                 flush_interval):
+        self.enabled = enabled
+        self.path_template = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.path = None
+        self._queue = deque()
+        self._wake = None
+        self._task = None
+        self._stopping = False
+        self._file = None
+        self._opened_at = None
+        self._written = USAGE_LEDGER_RECORDS.labels(outcome="written")
+        self._dropped = USAGE_LEDGER_RECORDS.labels(outcome="dropped")
+        self._failed = USAGE_LEDGER_RECORDS.labels(outcome="failed")
+
+    def record(self, user_id, provider, model, input_tokens, output_tokens, ttft, duration, status):
+        if not self.enabled:
+            return
+        queue = self._queue
+        if len(queue) >= self.queue_size:
+            self._dropped.inc()
+            return
+        
+        queue.append((time.time(), user_id, provider, model, input_tokens, output_tokens, ttft, duration, status))
+        USAGE_LEDGER_QUEUE_DEPTH.set(len(queue))
+        if len(queue) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    def record_request(self, state, status, duration):
+        """Record for a request handled by the router, from what it left in
+        the request state"""
+        usage = state.get("usage")
+        if usage:
+            provider, model, input_tokens, output_tokens = usage
+        else:
+            provider, model, input_tokens, output_tokens = state.get("provider"), state.get("model"), 0, 0
+        self.record(state.get("user_id"), provider, model, input_tokens, output_tokens,
+                    state.get("ttft"), duration, status)
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        # Formatted here rather than at import so every worker gets its own
+        self.path = self.path_template.format(pid=os.getpid())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Cancelling could interrupt a write running in a thread; let the
+        # task drain the queue and exit instead
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+            if self._stopping:
+                return
+            if self._file is not None and self._rotation_due():
+                await asyncio.to_thread(self._rotate)
+
+    async def _flush(self):
+        queue = self._queue
+        while queue:
+            batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+            USAGE_LEDGER_QUEUE_DEPTH.set(len(queue))
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.warning("Failed to write %d usage records to %s: %s", len(batch), self.path, e)
+                self._failed.inc(len(batch))
+            else:
+                self._written.inc(len(batch))
+        USAGE_LEDGER_QUEUE_DEPTH.set(0)
+
+    def _write(self, batch):
+        lines = b"".join([orjson.dumps({
+            "ts": round(ts, 3),
+            "user_id": user_id,
+            "provider": provider,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "duration": round(duration, 4),
+            "status": status
+        }) + b"\n" for ts, user_id, provider, model, input_tokens, output_tokens, ttft, duration, status in batch])
+        
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            self._opened_at = time.monotonic()
+        self._file.write(lines)
+        self._file.flush()
+        if self._rotation_due():
+            self._rotate()
+
+    def _rotation_due(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        
+        base, extension = os.path.splitext(self.path)
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        target = f"{base}.{stamp}{extension}"
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{base}.{stamp}-{suffix}{extension}"
+            suffix += 1
+        os.rename(self.path, target)
+        
+        if self.compress:
+            with open(target, "rb") as source, gzip.open(target + ".gz", "wb") as compressed:
+                shutil.copyfileobj(source, compressed)
+            os.remove(target)
+
+
+usage_ledger = UsageLedger(
+    enabled=settings.USAGE_LEDGER_ENABLED,
+    path=settings.USAGE_LEDGER_PATH,
+    max_bytes=settings.USAGE_LEDGER_MAX_BYTES,
+    rotate_interval=settings.USAGE_LEDGER_ROTATE_INTERVAL,
+    compress=settings.USAGE_LEDGER_COMPRESS,
+    queue_size=settings.USAGE_LEDGER_QUEUE_SIZE,
+    batch_size=settings.USAGE_LEDGER_BATCH_SIZE,
+    flush_interval=settings.USAGE_LEDGER_FLUSH_INTERVAL
+)
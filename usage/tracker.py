@@ -0,0 +1,107 @@
+import re
+
+from limits.rate_limiter import CHARS_PER_TOKEN
+from providers.base import RawResponse
+from streaming.sse import iter_usage, iter_text, text_length
+
+
+PENDING_TEXT_LIMIT = 1024
+USAGE_WINDOW = 512
+USAGE_FIELD_PATTERN = re.compile(rb'"(prompt_tokens|completion_tokens|input_tokens|output_tokens)"\s*:\s*(\d+)')
+
+
+def usage_from_body(body):
+    """Read token counts from a raw JSON body without parsing the rest of
+    it. Keys inside string values are escaped, so the last bare "usage"
+    key is the top-level one"""
+    start = body.rfind(b'"usage"')
+    if start < 0:
+        return None
+    
+    fields = {}
+    for match in USAGE_FIELD_PATTERN.finditer(body, start, start + USAGE_WINDOW):
+        fields.setdefault(match.group(1), int(match.group(2)))
+    
+    if b"prompt_tokens" in fields:
+        return fields[b"prompt_tokens"], fields.get(b"completion_tokens", 0)
+    if b"input_tokens" in fields:
+        return fields[b"input_tokens"], fields.get(b"output_tokens", 0)
+    return None
+
+
+def usage_from_response(response):
+    if isinstance(response, RawResponse):
+        return usage_from_body(response.body)
+    if not isinstance(response, dict):
+        return None
+    
+    usage = response.get("usage")
+    if not usage:
+        return None
+    
+    if "prompt_tokens" in usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    if "input_tokens" in usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    return None
+
+
+class StreamUsageTracker:
+    
+    def __init__(self, tokenizer, count_text=True):
+        self.tokenizer = tokenizer
+        self.count_text = count_text and tokenizer.available
+        self.input_tokens = None
+        self.output_tokens = None
+        self.counted_output_tokens = 0
+        self.text_bytes = 0
+        self._pending = []
+        self._pending_len = 0
+
+    def feed(self, frames):
+        for usage in iter_usage(frames):
+            self._update_usage(usage)
+        
+        if self.output_tokens is not None:
+            return
+        if self.count_text:
+            for text in iter_text(frames):
+                self._pending.append(text)
+                self._pending_len += len(text)
+            if self._pending_len >= PENDING_TEXT_LIMIT:
+                self._flush()
+        else:
+            # Usage arrives with the last chunk; keep enough to estimate it
+            # if the stream is cut short
+            self.text_bytes += text_length(frames)
+
+    def finish(self):
+        """Usage of the stream so far. Output tokens are estimated from the
+        text when the upstream never reported them, e.g. a stream cut short
+        or a provider that left out the usage chunk"""
+        if self.output_tokens is not None:
+            self._pending = []
+            self._pending_len = 0
+            return self.input_tokens, self.output_tokens
+        
+        if not self.count_text:
+            return self.input_tokens, self.text_bytes // CHARS_PER_TOKEN
+        self._flush()
+        return self.input_tokens, self.counted_output_tokens
+
+    def _update_usage(self, usage):
+        if "prompt_tokens" in usage:
+            self.input_tokens = usage["prompt_tokens"]
+        elif "input_tokens" in usage:
+            self.input_tokens = usage["input_tokens"]
+        
+        if "completion_tokens" in usage:
+            self.output_tokens = usage["completion_tokens"]
+        elif "output_tokens" in usage:
+            self.output_tokens = usage["output_tokens"]
+
+    def _flush(self):
+        if self._pending:
+            self.counted_output_tokens += self.tokenizer.count_inline("".join(self._pending))
+            self._pending = []
+            self._pending_len = 0